@@ -1,163 +1,497 @@
 # Copyright (c) 2021 Future Internet Consulting and Development Solutions S.L.
 
-import importlib
-import xml.etree.cElementTree as ET
+import functools
+import hashlib
+import json
+import sys
+import threading
+import types
+import xml.etree.ElementTree as ET
 from typing import Optional
 
 from odata_server import meta
 
+# Attribute kinds, resolved once per class by EdmItemBase._resolve_attrs.
+# EdmItem kinds are in the [KIND_EDMITEM, KIND_LIST) range and list of
+# EdmItems kinds are greater or equal than KIND_LIST
+KIND_SCALAR = 0
+KIND_STATIC = 1
+KIND_EDMITEM = 2
+KIND_DATASERVICES = 3
+KIND_LIST = 4
+KIND_LIST_NAV_BINDING = 5
+KIND_LIST_ANNOTATION = 6
+
+XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+# Same escaping rules used by xml.etree.ElementTree when serializing
+_XML_ATTRIB_ESCAPE = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        "\r": "&#13;",
+        "\n": "&#10;",
+        "\t": "&#09;",
+    }
+)
+_XML_TEXT_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_ESCAPE_CACHE_SIZE = 4096
+_escape_attrib_cache = {}
+
+# Marks attributes not present on a definition
+_MISSING = object()
+
+# JSON keys of annotations, keyed by (Term, Qualifier)
+_ANNOTATION_KEY_CACHE_SIZE = 10000
+_annotation_key_cache = {}
+
+
+# Edmx instances built by Edmx.from_definition, keyed by (class, definition hash)
+_EDMX_CACHE_SIZE = 32
+_EDMX_CACHE = {}
+_EDMX_CACHE_LOCK = threading.Lock()
+
+
+def escape_attrib(value: str) -> str:
+    escaped = _escape_attrib_cache.get(value)
+    if escaped is None:
+        escaped = value.translate(_XML_ATTRIB_ESCAPE)
+        if len(_escape_attrib_cache) >= _ESCAPE_CACHE_SIZE:
+            _escape_attrib_cache.clear()
+        _escape_attrib_cache[value] = escaped
+    return escaped
+
+
+def escape_text(value: str) -> str:
+    return value.translate(_XML_TEXT_ESCAPE)
+
+
+def annotation_key(term: str, qualifier: Optional[str] = None) -> str:
+    cache_key = (term, qualifier)
+    key = _annotation_key_cache.get(cache_key)
+    if key is None:
+        key = f"@{term}#{qualifier}" if qualifier is not None else f"@{term}"
+        key = sys.intern(key)
+        if len(_annotation_key_cache) >= _ANNOTATION_KEY_CACHE_SIZE:
+            _annotation_key_cache.clear()
+        _annotation_key_cache[cache_key] = key
+    return key
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_type(type_name: str) -> tuple:
+    """
+    Returns a (iscollection, qualified name, name) tuple describing the given
+    type reference, e.g. ``Collection(ODataDemo.Product)``.
+    """
+    iscollection = type_name.startswith("Collection(")
+    if iscollection:
+        type_name = type_name[11:-1]
+
+    return iscollection, type_name, type_name.rsplit(".", 1)[-1]
+
+
+def _compile_method(cls, method_name, lines, namespace):
+    source = "\n".join(lines)
+    code = compile(source, f"<edm {cls.__name__}.{method_name}>", "exec")
+    exec(code, namespace)
+    method = namespace[method_name]
+    method._generated = True
+    return method
+
+
+def _generate_init(cls):
+    attrs_fast = cls._attrs_fast
+    if attrs_fast is None:
+        attrs_fast = cls._resolve_attrs()
+
+    namespace = {"_MISSING": _MISSING, "_intern": sys.intern}
+    lines = [
+        "def __init__(self, definition, parent=None):",
+        "    self.parent = parent",
+    ]
+    if cls._wrapped_element is not None:
+        lines += [
+            "    if type(definition) == list:",
+            f"        definition = {{{cls._wrapped_element!r}: definition}}",
+        ]
+
+    lines.append("    get = definition.get")
+    for i, (attr_name, kind, attr, item_type, *_) in enumerate(attrs_fast):
+        namespace[f"_type{i}"] = item_type
+        if kind >= KIND_LIST:
+            namespace[f"_default{i}"] = attr.default
+            lines += [
+                f"    value = get({attr_name!r}, _default{i})",
+                f"    self.{attr_name} = [_type{i}(item, self) for item in value]",
+            ]
+            continue
+
+        if attr.interned:
+            converted = f"_intern(_type{i}(value))"
+        else:
+            converted = f"_type{i}(value)"
+        assignment = f"self.{attr_name} = {converted} if value is not None else None"
+
+        if attr.required:
+            lines += [
+                f"    value = get({attr_name!r}, _MISSING)",
+                "    if value is _MISSING:",
+                f"        raise ValueError({f'Missing {attr_name} attribute'!r})",
+                f"    {assignment}",
+            ]
+        elif attr.default is None:
+            lines += [f"    value = get({attr_name!r})", f"    {assignment}"]
+        else:
+            # Absent attributes get their default value, converted once
+            default = item_type(attr.default)
+            namespace[f"_default{i}"] = (
+                sys.intern(default) if attr.interned else default
+            )
+            lines += [
+                f"    value = get({attr_name!r}, _MISSING)",
+                "    if value is _MISSING:",
+                f"        self.{attr_name} = _default{i}",
+                "    else:",
+                f"        {assignment}",
+            ]
+
+    if cls._post_init is not None:
+        lines.append("    self._post_init()")
+
+    return _compile_method(cls, "__init__", lines, namespace)
+
+
+def _generate_json(cls):
+    attrs_fast = cls._attrs_fast
+    if attrs_fast is None:
+        attrs_fast = cls._resolve_attrs()
+
+    namespace = {}
+    if cls._wrapped_element is not None:
+        lines = [
+            'def json(self, version="4.0"):',
+            f"    return [e.json() for e in self.{cls._wrapped_element}]",
+        ]
+        return _compile_method(cls, "json", lines, namespace)
+
+    lines = ['def json(self, version="4.0"):', "    data = {}"]
+    for i, (attr_name, kind, attr, item_type, final_attr_name) in enumerate(attrs_fast):
+        indent = "    "
+        if attr.version != "4.0":
+            lines.append(f"    if {attr.version!r} <= version:")
+            indent += "    "
+
+        if kind == KIND_STATIC:
+            lines.append(f"{indent}data[{final_attr_name!r}] = {attr.static!r}")
+            continue
+
+        lines.append(f"{indent}value = self.{attr_name}")
+        if kind == KIND_SCALAR and attr.json_default is not None:
+            namespace[f"_default{i}"] = attr.json_default
+            lines.append(f"{indent}if value is not None and value != _default{i}:")
+        else:
+            lines.append(f"{indent}if value is not None:")
+        indent += "    "
+
+        if kind == KIND_DATASERVICES:
+            lines += [
+                f"{indent}for entry in value.json():",
+                f'{indent}    data[entry["$Namespace"]] = entry',
+                f'{indent}    del entry["$Namespace"]',
+            ]
+        elif kind == KIND_EDMITEM:
+            lines.append(f"{indent}data[{final_attr_name!r}] = value.json()")
+        elif kind == KIND_LIST_NAV_BINDING:
+            lines += [
+                f"{indent}for entry in value:",
+                f"{indent}    data[entry.Path] = entry.Target",
+            ]
+        elif kind == KIND_LIST_ANNOTATION:
+            lines += [
+                f"{indent}for e in value:",
+                f"{indent}    key, avalue = e.json()",
+                f"{indent}    data[key] = avalue",
+            ]
+        elif kind == KIND_LIST:
+            key = f"${item_type.jsonkey}"
+            lines += [
+                f"{indent}for e in value:",
+                f"{indent}    subvalue = e.json()",
+                f"{indent}    key_value = subvalue.pop({key!r})",
+            ]
+            if item_type.__name__ != cls._defaultsubkind:
+                lines.append(f'{indent}    subvalue["$Kind"] = {item_type.__name__!r}')
+            lines.append(f"{indent}    data[key_value] = subvalue")
+        else:
+            lines.append(f"{indent}data[{final_attr_name!r}] = value")
+
+    lines.append("    return data")
+    return _compile_method(cls, "json", lines, namespace)
+
+
+def _generate_xml(cls):
+    attrs_fast = cls._attrs_fast
+    if attrs_fast is None:
+        attrs_fast = cls._resolve_attrs()
+
+    namespace = {"Element": ET.Element}
+    lines = [
+        'def xml(self, version="4.0"):',
+        f"    root = Element({cls._xml_tag!r})",
+        "    set = root.set",
+        "    append = root.append",
+    ]
+    for ns_attr, ns_uri in cls._namespace_items:
+        lines.append(f"    set({ns_attr!r}, {ns_uri!r})")
+
+    for i, (attr_name, kind, attr, *_) in enumerate(attrs_fast):
+        indent = "    "
+        if attr.version != "4.0":
+            lines.append(f"    if {attr.version!r} <= version:")
+            indent += "    "
+
+        if kind == KIND_STATIC:
+            lines.append(f"{indent}set({attr_name!r}, {attr.static!r})")
+            continue
+
+        lines.append(f"{indent}value = self.{attr_name}")
+        if kind == KIND_SCALAR and attr.xml_default is not None:
+            namespace[f"_default{i}"] = attr.xml_default
+            lines.append(f"{indent}if value is not None and value != _default{i}:")
+        else:
+            lines.append(f"{indent}if value is not None:")
+        indent += "    "
+
+        if kind >= KIND_LIST:
+            lines += [
+                f"{indent}for e in value:",
+                f"{indent}    append(e.xml())",
+            ]
+        elif kind >= KIND_EDMITEM:
+            lines.append(f"{indent}append(value.xml())")
+        elif attr.type == bool:
+            lines.append(f'{indent}set({attr_name!r}, "true" if value else "false")')
+        else:
+            lines.append(f"{indent}set({attr_name!r}, str(value))")
+
+    lines.append("    return root")
+    return _compile_method(cls, "xml", lines, namespace)
+
+
+def _generate_write_xml(cls):
+    attrs_fast = cls._attrs_fast
+    if attrs_fast is None:
+        attrs_fast = cls._resolve_attrs()
+
+    # Leaf classes (e.g. PropertyRef or NavigationPropertyBinding) only have
+    # XML attributes, so no children handling is needed
+    is_leaf = all(kind < KIND_EDMITEM for _, kind, *_ in attrs_fast)
+
+    namespace = {"escape_attrib": escape_attrib}
+    lines = [
+        'def _write_xml(self, out, version="4.0"):',
+        "    append = out.append",
+        f"    append({cls._xml_open!r})",
+    ]
+    if not is_leaf:
+        lines.append("    children = []")
+
+    for i, (attr_name, kind, attr, *_) in enumerate(attrs_fast):
+        indent = "    "
+        if attr.version != "4.0":
+            lines.append(f"    if {attr.version!r} <= version:")
+            indent += "    "
+
+        if kind == KIND_STATIC:
+            static = f' {attr_name}="{escape_attrib(attr.static)}"'
+            lines.append(f"{indent}append({static!r})")
+            continue
+
+        lines.append(f"{indent}value = self.{attr_name}")
+        if kind == KIND_SCALAR and attr.xml_default is not None:
+            namespace[f"_default{i}"] = attr.xml_default
+            lines.append(f"{indent}if value is not None and value != _default{i}:")
+        else:
+            lines.append(f"{indent}if value is not None:")
+        indent += "    "
+
+        if kind >= KIND_LIST:
+            lines.append(f"{indent}children.extend(value)")
+        elif kind >= KIND_EDMITEM:
+            lines.append(f"{indent}children.append(value)")
+        elif attr.type == bool:
+            true_attr = f' {attr_name}="true"'
+            false_attr = f' {attr_name}="false"'
+            lines.append(f"{indent}append({true_attr!r} if value else {false_attr!r})")
+        else:
+            attr_open = f' {attr_name}="'
+            lines.append(
+                f"{indent}append({attr_open!r} + escape_attrib(str(value)) + '\"')"
+            )
+
+    if is_leaf:
+        lines.append('    append(" />")')
+        return _compile_method(cls, "_write_xml", lines, namespace)
+
+    lines += [
+        "    if len(children) > 0:",
+        '        append(">")',
+        "        for child in children:",
+        "            child._write_xml(out)",
+        f"        append({cls._xml_close!r})",
+        "    else:",
+        '        append(" />")',
+    ]
+    return _compile_method(cls, "_write_xml", lines, namespace)
+
+
+def _compile_on_first_call(cls, method_name, generate):
+    def method(self, *args, **kwargs):
+        generated = generate(cls)
+        setattr(cls, method_name, generated)
+        return generated(self, *args, **kwargs)
+
+    method._generated = True
+    return method
+
+
+def _has_custom_method(cls, method_name):
+    for klass in cls.__mro__:
+        if klass is EdmItem:
+            return False
+
+        method = klass.__dict__.get(method_name)
+        if method is not None:
+            return not getattr(method, "_generated", False)
+
+    return False
+
 
 class EdmItemBase(type):
     def __new__(cls, name, bases, attrs, **kwargs):
         prefix = attrs.pop("prefix", None)
         defaultsubkind = attrs.pop("defaultsubkind", None)
         namespaces = attrs.pop("namespaces", {})
+        extra_slots = attrs.pop("extra_slots", ())
+
+        attributes = {
+            attr_name: attr
+            for attr_name, attr in attrs.items()
+            if isinstance(attr, meta.attribute)
+        }
+        inherited = {}
+        for base in bases:
+            inherited.update(getattr(base, "_attrs", ()))
+
+        if "__slots__" not in attrs:
+            # Attribute values are stored in slots, their definitions are
+            # only reachable through _attrs
+            for attr_name in attributes:
+                del attrs[attr_name]
+            attrs["__slots__"] = (
+                tuple(
+                    attr_name for attr_name in attributes if attr_name not in inherited
+                )
+                + extra_slots
+            )
 
         new_class = super().__new__(cls, name, bases, attrs, **kwargs)
         class_name = new_class.__name__
 
-        new_class._attrs = {}
-        for base in bases:
-            new_class._attrs.update(base._attrs)
-        new_class._attrs.update(
-            {
-                attr_name: attr
-                for attr_name, attr in attrs.items()
-                if isinstance(attr, meta.attribute)
-            }
-        )
+        # Attribute definitions are never modified after class creation
+        new_class._attrs = types.MappingProxyType({**inherited, **attributes})
         new_class._xml_tag = (
-            "{}:{}".format(prefix, class_name) if prefix is not None else class_name
+            f"{prefix}:{class_name}" if prefix is not None else class_name
         )
         new_class._namespaces = namespaces
+        new_class._namespace_items = tuple(
+            (f"xmlns:{ns_prefix}" if ns_prefix != "" else "xmlns", ns_uri)
+            for ns_prefix, ns_uri in namespaces.items()
+        )
+        new_class._xml_open = f"<{new_class._xml_tag}" + "".join(
+            f' {ns_attr}="{escape_attrib(ns_uri)}"'
+            for ns_attr, ns_uri in new_class._namespace_items
+        )
+        new_class._xml_close = f"</{new_class._xml_tag}>"
         new_class._defaultsubkind = defaultsubkind
-        attr_list = tuple(new_class._attrs.items())
+        attrs_items = new_class._attrs_items = tuple(new_class._attrs.items())
         new_class._wrapped_element = (
-            attr_list[0][0]
-            if len(attr_list) == 1 and attr_list[0][1].type == list
+            attrs_items[0][0]
+            if len(attrs_items) == 1 and attrs_items[0][1].type == list
             else None
         )
+        # Attribute types may reference classes defined later in this module,
+        # so their classification is delayed until the class is first used
+        new_class._attrs_fast = None
+
+        # Specialized __init__, json(), xml() and XML writer methods are generated
+        # from the attribute definitions, except for classes providing their own
+        if len(bases) > 0:
+            for method_name, generate in (
+                ("__init__", _generate_init),
+                ("json", _generate_json),
+                ("xml", _generate_xml),
+                ("_write_xml", _generate_write_xml),
+            ):
+                if not _has_custom_method(new_class, method_name):
+                    setattr(
+                        new_class,
+                        method_name,
+                        _compile_on_first_call(new_class, method_name, generate),
+                    )
 
         return new_class
 
-
-class EdmItem(metaclass=EdmItemBase):
-    def __init__(self, definition: dict, parent: Optional[EdmItemBase] = None):
-        self.parent = parent
-
-        wrapped_element = self.__class__._wrapped_element
-        if wrapped_element is not None and type(definition) == list:
-            definition = {wrapped_element: definition}
-
-        for attr_name, attr in self.__class__._attrs.items():
-            if attr.required and attr_name not in definition:
-                raise ValueError("Missing {} attribute".format(attr_name))
-
-            value = definition.get(attr_name, attr.default)
-            if attr.type == list:
-                setattr(self, attr_name, [attr.items(item, self) for item in value])
-            elif issubclass(attr.type, EdmItem) and value is not None:
-                setattr(self, attr_name, attr.type(value))
-            elif value is not None:
-                setattr(self, attr_name, attr.type(value))
-            else:
-                setattr(self, attr_name, None)
-
-    def xml(self, version="4.0"):
-        root = ET.Element(self.__class__._xml_tag)
-
-        for ns_prefix, ns_uri in self.__class__._namespaces.items():
-            root.set(
-                "xmlns:{}".format(ns_prefix) if ns_prefix != "" else "xmlns", ns_uri
-            )
-
-        for attr_name, attr in self.__class__._attrs.items():
-            if attr.version > version:
-                continue
-
+    def _resolve_attrs(cls):
+        attrs_fast = []
+        for attr_name, attr in cls._attrs_items:
             if attr.static is not None:
-                root.set(attr_name, attr.static)
-                continue
-
-            value = getattr(self, attr_name)
-            if value is None:
-                continue
-            elif issubclass(attr.type, EdmItem):
-                root.append(value.xml())
+                kind = KIND_STATIC
+                item_type = attr.type
             elif attr.type == list and issubclass(attr.items, EdmItem):
-                for e in value:
-                    root.append(e.xml())
-            elif attr.xml_default is None or value != attr.xml_default:
-                if type(value) == bool:
-                    root.set(attr_name, "true" if value else "false")
+                item_type = attr.items
+                if issubclass(item_type, NavigationPropertyBinding):
+                    kind = KIND_LIST_NAV_BINDING
+                elif issubclass(item_type, Annotation):
+                    kind = KIND_LIST_ANNOTATION
+                else:
+                    kind = KIND_LIST
+            elif attr.type != list and issubclass(attr.type, EdmItem):
+                item_type = attr.type
+                if issubclass(item_type, DataServices):
+                    kind = KIND_DATASERVICES
                 else:
-                    root.set(attr_name, str(value))
+                    kind = KIND_EDMITEM
+            else:
+                kind = KIND_SCALAR
+                item_type = attr.items if attr.type == list else attr.type
 
-        return root
+            attrs_fast.append((attr_name, kind, attr, item_type, f"${attr_name}"))
 
-    def json(self, version="4.0"):
-        wrapped_element = self.__class__._wrapped_element
-        if wrapped_element is not None:
-            value = getattr(self, wrapped_element)
-            return [e.json() for e in value]
+        cls._attrs_fast = tuple(attrs_fast)
+        return cls._attrs_fast
 
-        data = {}
 
-        for attr_name, attr in self.__class__._attrs.items():
-            if attr.version > version:
-                continue
+class EdmItem(metaclass=EdmItemBase):
 
-            final_attr_name = "${}".format(attr_name)
-            if attr.static is not None:
-                data[final_attr_name] = attr.static
-                continue
-
-            value = getattr(self, attr_name)
-            if value is None:
-                continue
-            elif issubclass(attr.type, DataServices):
-                # TODO particular case
-                key = "$Namespace"
-
-                for entry in value.json():
-                    data[entry[key]] = entry
-                    del entry[key]
-            elif issubclass(attr.type, EdmItem):
-                data[final_attr_name] = value.json()
-            elif attr.type == list:
-
-                if issubclass(attr.items, NavigationPropertyBinding):
-                    # TODO particular case
-                    key_attr = "Path"
-                    value_attr = "Target"
-
-                    for entry in value:
-                        data[getattr(entry, key_attr)] = getattr(entry, value_attr)
-                elif issubclass(attr.items, Annotation):
-                    for e in value:
-                        key, avalue = e.json()
-                        data[key] = avalue
-                elif issubclass(attr.items, EdmItem):
-                    subkind = (
-                        attr.items.__name__
-                        if attr.items.__name__ != self.__class__._defaultsubkind
-                        else None
-                    )
-                    key = "${}".format(attr.items.jsonkey)
-                    for e in value:
-                        subvalue = e.json()
-                        key_value = subvalue[key]
-                        if subkind is not None:
-                            subvalue["$Kind"] = subkind
-                        if key in subvalue:
-                            del subvalue[key]
-                        data[key_value] = subvalue
-            elif value is not None and (
-                attr.json_default is None or value != attr.json_default
-            ):
-                data[final_attr_name] = value
+    # Attributes attached by process() are declared through extra_slots, but
+    # users of the model may attach others, so a __dict__ is kept as well
+    __slots__ = ("parent", "__dict__", "__weakref__")
+
+    # Optional method completing the initialization of an EdmItem once its
+    # attributes are set
+    _post_init = None
+
+    # __init__, json(), xml() and _write_xml() are generated for each subclass
+    # by EdmItemBase
 
-        return data
+    def xml_bytes(self, version="4.0"):
+        out = []
+        self._write_xml(out, version)
+        return "".join(out).encode("utf-8")
 
 
 class Null(EdmItem):
@@ -180,6 +514,16 @@ class Null(EdmItem):
             root.append(annotation.xml())
         return root
 
+    def _write_xml(self, out, version="4.0"):
+        if len(self.Annotations) == 0:
+            out.append("<Null />")
+            return
+
+        out.append("<Null>")
+        for annotation in self.Annotations:
+            annotation._write_xml(out)
+        out.append("</Null>")
+
     def json(self):
         if len(self.Annotations) == 0:
             return None
@@ -210,6 +554,16 @@ class Collection(EdmItem):
 
         return root
 
+    def _write_xml(self, out, version="4.0"):
+        if len(self.Items) == 0:
+            out.append("<Collection />")
+            return
+
+        out.append("<Collection>")
+        for Item in self.Items:
+            Item._write_subxml(out)
+        out.append("</Collection>")
+
     def json(self):
         return [i.subjson() for i in self.Items]
 
@@ -249,16 +603,17 @@ class ValueExpressionItem(EdmItem):
         "PropertyPath",
         "Path",
     )
-    _type = None
+    extra_slots = ("_type",)
+
+    def _post_init(self):
+        self._type = None
+        for field in self.all_types:
+            if getattr(self, field) is not None:
+                self._type = field
+                break
 
     @property
     def type(self):
-        if self._type is None:
-            for field in self.all_types:
-                if getattr(self, field) is not None:
-                    self._type = field
-                    break
-
         return self._type
 
     @property
@@ -286,6 +641,20 @@ class ValueExpressionItem(EdmItem):
         else:
             return getattr(self, self.type).xml()
 
+    def _write_subxml(self, out):
+        if self.type in self.attr_types:
+            if self.type == "Bool":
+                text = "true" if self.value else "false"
+            else:
+                text = escape_text(str(self.value))
+
+            if text == "":
+                out.append(f"<{self.type} />")
+            else:
+                out.append(f"<{self.type}>{text}</{self.type}>")
+        else:
+            getattr(self, self.type)._write_xml(out)
+
     def subjson(self):
         if self.type in self.attr_types:
             return getattr(self, self.type)
@@ -306,7 +675,7 @@ class PropertyValue(ValueExpressionItem):
 
 class Record(EdmItem):
 
-    Type = meta.attribute(str)
+    Type = meta.attribute(str, interned=True)
     PropertyValues = meta.element(list, items=PropertyValue)
     Annotations = meta.element(list, items="Annotation")
 
@@ -331,18 +700,20 @@ class Record(EdmItem):
 
 class Annotation(ValueExpressionItem):
 
-    Term = meta.attribute(str, required=True)
+    extra_slots = ("_json_key",)
+
+    Term = meta.attribute(str, required=True, interned=True)
     Qualifier = meta.attribute(str)
     Target = meta.attribute(str)
 
     Annotations = meta.element(list, items="Annotation")
 
-    def json(self):
-        key = "@{}".format(self.Term)
-        if self.Qualifier is not None:
-            key += "#{}".format(self.Qualifier)
+    def _post_init(self):
+        super()._post_init()
+        self._json_key = annotation_key(self.Term, self.Qualifier)
 
-        return key, self.subjson()
+    def json(self):
+        return self._json_key, self.subjson()
 
 
 class OnDelete(EdmItem):
@@ -353,9 +724,10 @@ class OnDelete(EdmItem):
 class NavigationProperty(EdmItem):
 
     jsonkey = "Name"
+    extra_slots = ("annotations", "entity_type", "iscollection", "isembedded")
 
     Name = meta.attribute(str, required=True)
-    Type = meta.attribute(str, required=True)
+    Type = meta.attribute(str, required=True, interned=True)
     Nullable = meta.attribute(bool, json_default=False, xml_default=True)
     Partner = meta.attribute(str)
     ContainsTarget = meta.attribute(bool)
@@ -363,9 +735,8 @@ class NavigationProperty(EdmItem):
     Annotations = meta.element(list, items=Annotation)
     # public referentialConstraints: Array<ReferentialConstraint>
 
-    def __init__(self, definition: dict, parent: Optional[EdmItemBase] = None):
-        super().__init__(definition, parent)
-        self.iscollection = self.Type.startswith("Collection(")
+    def _post_init(self):
+        self.iscollection = parse_type(self.Type)[0]
         if self.iscollection:
             self.Nullable = None
 
@@ -373,9 +744,10 @@ class NavigationProperty(EdmItem):
 class Property(EdmItem):
 
     jsonkey = "Name"
+    extra_slots = ("annotations", "iscollection")
 
     Name = meta.attribute(str, required=True)
-    Type = meta.attribute(str, json_default="Edm.String")
+    Type = meta.attribute(str, json_default="Edm.String", interned=True)
     Nullable = meta.attribute(
         bool, default=False, json_default=False, xml_default=meta.NODEFAULT
     )
@@ -394,12 +766,11 @@ class PropertyRef(EdmItem):
     Alias = meta.attribute(str)
 
     def json(self):
-        if self.Alias is None:
+        alias = self.Alias
+        if alias is None:
             return self.Name
-        else:
-            return {
-                self.Alias: self.Name,
-            }
+
+        return {alias: self.Name}
 
 
 class Key(EdmItem):
@@ -411,12 +782,26 @@ class EntityType(EdmItem):
 
     jsonkey = "Name"
     defaultsubkind = "Property"
+    extra_slots = (
+        "annotations",
+        "computed_properties",
+        "default_projection",
+        "key_properties",
+        "members",
+        "names",
+        "navproperties",
+        "nullable_properties",
+        "properties",
+        "property_list",
+        "required_properties",
+        "virtual_entities",
+    )
 
     Name = meta.attribute(str, required=True)
     Key = meta.attribute(Key)
     Properties = meta.attribute(list, items=Property)
     NavigationProperties = meta.attribute(list, items=NavigationProperty)
-    BaseType = meta.attribute(str)
+    BaseType = meta.attribute(str, interned=True)
     Abstract = meta.attribute(bool)
     OpenType = meta.attribute(bool)
     HasStream = meta.attribute(bool)
@@ -432,9 +817,17 @@ class NavigationPropertyBinding(EdmItem):
 class EntitySet(EdmItem):
 
     jsonkey = "Name"
+    extra_slots = (
+        "annotations",
+        "bindings",
+        "custom_insert_business",
+        "entity_type",
+        "mongo_collection",
+        "prefix",
+    )
 
     Name = meta.attribute(str, required=True)
-    EntityType = meta.attribute(str, required=True)
+    EntityType = meta.attribute(str, required=True, interned=True)
     IncludeInServiceDocument = meta.attribute(bool, default=True)
     NavigationPropertyBindings = meta.element(list, items=NavigationPropertyBinding)
     Annotations = meta.element(list, items=Annotation)
@@ -453,6 +846,7 @@ class ActionImport(EdmItem):
 class EntityContainer(EdmItem):
 
     jsonkey = "Name"
+    extra_slots = ("entity_sets_by_id",)
 
     Name = meta.attribute(str, required=True)
     EntitySets = meta.element(list, items=EntitySet)
@@ -468,7 +862,7 @@ class ComplexType(EdmItem):
     defaultsubkind = "Property"
 
     Name = meta.attribute(str, required=True)
-    BaseType = meta.attribute(str)
+    BaseType = meta.attribute(str, interned=True)
     Abstract = meta.attribute(bool)
     OpenType = meta.attribute(bool)
     HasStream = meta.attribute(bool)
@@ -482,7 +876,7 @@ class Parameter(EdmItem):
     jsonkey = "Name"
 
     Name = meta.attribute(str, required=True)
-    Type = meta.attribute(str, required=True)
+    Type = meta.attribute(str, required=True, interned=True)
     Nullable = meta.attribute(bool, json_default=False)
     MaxLength = meta.attribute(int)
     Precision = meta.attribute(float)
@@ -494,7 +888,7 @@ class Parameter(EdmItem):
 
 class ReturnType(EdmItem):
 
-    Type = meta.attribute(str, required=True)
+    Type = meta.attribute(str, required=True, interned=True)
     Nullable = meta.attribute(bool, json_default=False)
     MaxLength = meta.attribute(int)
     Precision = meta.attribute(float)
@@ -518,6 +912,7 @@ class Action(EdmItem):
 class Schema(EdmItem):
 
     jsonkey = "Namespace"
+    extra_slots = ("entity_types_by_id",)
 
     Namespace = meta.attribute(str, required=True)
     Alias = meta.attribute(str)
@@ -564,16 +959,30 @@ def get_annotation(item, annotation, default=""):
         return default
 
 
-def pop_annotation(item, annotation, default=""):
-    if annotation in item.annotations:
-        value = item.annotations[annotation].value
-        item.Annotations.remove(item.annotations[annotation])
-        del item.annotations[annotation]
+@functools.cache
+def resolve_code_reference(path: str):
+    import importlib
 
-        return value
-    else:
+    module, func = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), func)
+
+
+# Annotations added to every entity container by Edmx.process()
+ODATA_VERSIONS_ANNOTATION = {"Term": "Org.OData.Core.V1.ODataVersions", "String": "4.0"}
+CONFORMANCE_LEVEL_ANNOTATION = {
+    "Term": "Org.OData.Capabilities.V1.ConformanceLevel",
+    "EnumMember": "Org.OData.Capabilities.V1.ConformanceLevelType/Minimal",
+}
+
+
+def pop_annotation(item, annotation, default=""):
+    annotation_item = item.annotations.pop(annotation, None)
+    if annotation_item is None:
         return default
 
+    item.Annotations.remove(annotation_item)
+    return annotation_item.value
+
 
 def set_annotation_default_value(item, annotation, value):
     if annotation in item.annotations:
@@ -598,36 +1007,50 @@ def process_entity_type(entity_type, schema=None):
         entity_type.key_properties = None
 
     if schema is not None:
-        entity_type.names = set(("{}.{}".format(schema.Namespace, entity_type.Name),))
-        if schema.Alias is not None:
-            entity_type.names.add("{}.{}".format(schema.Alias, entity_type.Name))
+        qualified_name = f"{schema.Namespace}.{entity_type.Name}"
+        entity_type.names = frozenset(
+            (qualified_name,)
+            if schema.Alias is None
+            else (qualified_name, f"{schema.Alias}.{entity_type.Name}")
+        )
     else:
         entity_type.names = entity_type.Name
 
     # Structural properties
-    entity_type.properties = {t.Name: t for t in entity_type.Properties}
-    entity_type.property_list = tuple(entity_type.properties.values())
-    entity_type.computed_properties = set()
-    entity_type.nullable_properties = set()
+    properties = {t.Name: t for t in entity_type.Properties}
+    entity_type.property_list = tuple(properties.values())
+    computed_properties = set()
+    nullable_properties = set()
     for prop in entity_type.property_list:
         process_annotations(prop)
         computed = pop_annotation(prop, "Org.OData.Core.V1.Computed", False)
-        prop.iscollection = prop.Type.startswith("Collection(")
+        prop.iscollection = parse_type(prop.Type)[0]
         if computed:
-            entity_type.computed_properties.add(prop.Name)
+            computed_properties.add(prop.Name)
         if not prop.iscollection and prop.Nullable:
-            entity_type.nullable_properties.add(prop.Name)
+            nullable_properties.add(prop.Name)
+    # These lookup tables are only read once processed, freeze them
+    entity_type.properties = types.MappingProxyType(properties)
+    entity_type.computed_properties = frozenset(computed_properties)
+    entity_type.nullable_properties = frozenset(nullable_properties)
+    entity_type.required_properties = tuple(
+        name
+        for name in properties
+        if name not in computed_properties and name not in nullable_properties
+    )
+    # Projection used for reading entities when no $select is provided.
+    # Key properties are structural properties, so it does not depend on
+    # whether keys are requested
+    entity_type.default_projection = types.MappingProxyType(
+        {"_id": 0, "uuid": 1, **dict.fromkeys(properties, 1)}
+    )
 
     # Navigation properties
-    entity_type.navproperties = {t.Name: t for t in entity_type.NavigationProperties}
+    navproperties = {t.Name: t for t in entity_type.NavigationProperties}
+    entity_type.navproperties = types.MappingProxyType(navproperties)
     virtual_entities = set()
     for navigation_property in entity_type.NavigationProperties:
-        type_name = (
-            navigation_property.Type[11:-1]
-            if navigation_property.iscollection
-            else navigation_property.Type
-        )
-        type_name = type_name.rsplit(".", 1)[1]
+        type_name = parse_type(navigation_property.Type)[2]
         navigation_property.entity_type = schema.entity_types_by_id[type_name]
         process_annotations(navigation_property)
         navigation_property.isembedded = pop_annotation(
@@ -635,7 +1058,11 @@ def process_entity_type(entity_type, schema=None):
         )
         if navigation_property.isembedded:
             virtual_entities.add(navigation_property.Name)
-    entity_type.virtual_entities = virtual_entities
+    entity_type.virtual_entities = frozenset(virtual_entities)
+
+    # Single lookup table for resolving paths, navigation properties take
+    # precedence over structural properties
+    entity_type.members = types.MappingProxyType({**properties, **navproperties})
 
     if entity_type.key_properties is not None:
         for key_prop in entity_type.key_properties:
@@ -661,51 +1088,120 @@ class Edmx(EdmItem):
     DataServices = meta.element(DataServices, required=True)
     References = meta.element(list, items=Reference)
 
-    def get_entity_type(self, type):
-        for schema in self.DataServices.Schemas:
-            if not type.startswith(schema.Namespace) and (
-                schema.Alias is None or not type.startswith(schema.Alias)
-            ):
-                continue
+    _processed = False
+    _entity_types_by_name = None
+    _serialization_cache = None
+
+    def _post_init(self):
+        self._serialization_lock = threading.Lock()
+
+    @classmethod
+    def from_definition(cls, definition):
+        """
+        Returns a processed Edmx instance for the given definition, with its
+        code references already resolved.
+
+        Instances are shared: equivalent definitions (e.g. the same
+        definition registered by several applications) get the same Edmx
+        object, so it must not be modified. Definitions failing to process
+        are not cached. Only the last few definitions are remembered.
+        """
+        definition_hash = hashlib.blake2b(
+            json.dumps(definition, sort_keys=True, default=str).encode("utf-8")
+        ).digest()
+        key = (cls, definition_hash)
+        with _EDMX_CACHE_LOCK:
+            edmx = _EDMX_CACHE.get(key)
+            if edmx is None:
+                # Prepare the instance before publishing it, so it is never
+                # modified while shared
+                edmx = cls(definition)
+                edmx.process()
+                edmx.resolve_code_references()
+                if len(_EDMX_CACHE) >= _EDMX_CACHE_SIZE:
+                    _EDMX_CACHE.clear()
+                _EDMX_CACHE[key] = edmx
+
+        return edmx
+
+    def clear_cache(self):
+        with self._serialization_lock:
+            self._serialization_cache = None
+
+    def _cached_serialization(self, key, serialize):
+        cache = self._serialization_cache
+        if cache is not None and key in cache:
+            return cache[key]
+
+        with self._serialization_lock:
+            if self._serialization_cache is None:
+                self._serialization_cache = {}
+            cache = self._serialization_cache
+            if key not in cache:
+                cache[key] = serialize()
+
+            return cache[key]
+
+    def json_bytes(self, version="4.0"):
+        # Only the serialized document is cached, json() keeps returning new
+        # dicts that callers are free to modify
+        return self._cached_serialization(
+            ("json_bytes", version),
+            lambda: json.dumps(self.json(version), ensure_ascii=False).encode("utf-8"),
+        )
 
-            for entity_type in schema.EntityTypes:
-                if type in entity_type.names:
-                    return entity_type
+    def xml_bytes(self, version="4.0"):
+        def serialize():
+            out = [XML_DECLARATION]
+            self._write_xml(out, version)
+            return "".join(out).encode("utf-8")
+
+        return self._cached_serialization(("xml", version), serialize)
 
-        # Not found
-        return None
+    def etag(self, format="xml", version="4.0"):
+        data = self.xml_bytes(version) if format == "xml" else self.json_bytes(version)
+        return self._cached_serialization(
+            ("etag", format, version),
+            lambda: hashlib.blake2b(data, digest_size=16).hexdigest(),
+        )
+
+    def get_entity_type(self, type):
+        # Entity types are indexed by qualified name by process()
+        if self._entity_types_by_name is None:
+            return None
+
+        return self._entity_types_by_name.get(type)
 
     def resolve_code_references(self):
+        self.clear_cache()
         for schema in self.DataServices.Schemas:
             for container in schema.EntityContainers:
                 for entity_set in container.EntitySets:
                     if type(entity_set.custom_insert_business) == str:
-                        module, func = entity_set.custom_insert_business.rsplit(".", 1)
-                        entity_set.custom_insert_business = getattr(
-                            importlib.import_module(module), func
+                        entity_set.custom_insert_business = resolve_code_reference(
+                            entity_set.custom_insert_business
                         )
 
     def process(self):
+        # Edmx instances may be shared through from_definition
+        if self._processed:
+            return
+
+        self.clear_cache()
+        entity_types_by_name = {}
         for schema in self.DataServices.Schemas:
             schema.entity_types_by_id = {e.Name: e for e in schema.EntityTypes}
 
             for entity_type in schema.EntityTypes:
                 process_entity_type(entity_type, schema)
+                for name in entity_type.names:
+                    entity_types_by_name.setdefault(name, entity_type)
+        self._entity_types_by_name = entity_types_by_name
 
+        for schema in self.DataServices.Schemas:
             for container in schema.EntityContainers:
-                container.Annotations.append(
-                    Annotation(
-                        {"Term": "Org.OData.Core.V1.ODataVersions", "String": "4.0"}
-                    )
-                )
-                container.Annotations.append(
-                    Annotation(
-                        {
-                            "Term": "Org.OData.Capabilities.V1.ConformanceLevel",
-                            "EnumMember": "Org.OData.Capabilities.V1.ConformanceLevelType/Minimal",
-                        }
-                    )
-                )
+                container.Annotations.append(Annotation(ODATA_VERSIONS_ANNOTATION))
+                container.Annotations.append(Annotation(CONFORMANCE_LEVEL_ANNOTATION))
                 container.entity_sets_by_id = {s.Name: s for s in container.EntitySets}
 
                 for entity_set in container.EntitySets:
@@ -742,3 +1238,18 @@ class Edmx(EdmItem):
                     entity_set.custom_insert_business = pop_annotation(
                         entity_set, "PythonODataServer.CustomInsertBusinessLogic", None
                     )
+
+                    # Entity sets are served using their name by default
+                    if "Org.OData.Core.V1.ResourcePath" not in entity_set.annotations:
+                        resource_path = Annotation(
+                            {
+                                "Term": "Org.OData.Core.V1.ResourcePath",
+                                "String": entity_set.Name,
+                            }
+                        )
+                        entity_set.annotations[resource_path.Term] = resource_path
+                        entity_set.Annotations.append(resource_path)
+
+        # Only flag the instance once processing succeeds, so a failing
+        # definition keeps reporting its error
+        self._processed = True
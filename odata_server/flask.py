@@ -1,16 +1,17 @@
 # Copyright (c) 2021-2022 Future Internet Consulting and Development Solutions S.L.
 
+import functools
 import json
 import logging
+import types
 import uuid
-import xml.etree.cElementTree as ET
-from urllib.parse import parse_qs as urllib_parse_qs
 
 import abnf
 import pymongo
 import pymongo.database
 import werkzeug
-from flask import Blueprint, Response, abort, request, url_for
+from flask import Blueprint, Response, abort, request
+from werkzeug.routing import PathConverter
 
 from odata_server import edm, settings
 from odata_server.utils import (
@@ -23,27 +24,70 @@ from odata_server.utils import (
     process_expand_fields,
 )
 from odata_server.utils.common import extract_id_value
-from odata_server.utils.flask import add_odata_annotations
+from odata_server.utils.flask import (
+    add_odata_annotations,
+    get_entity_set_url,
+    get_metadata_url,
+)
+from odata_server.utils.json import dumps
 from odata_server.utils.mongo import build_initial_projection, get_mongo_prefix
-from odata_server.utils.parse import ODataGrammar, parse_key_predicate, parse_qs
+from odata_server.utils.parse import (
+    ODataGrammar,
+    parse_key_predicate,
+    parse_navigation_path,
+    parse_qs,
+)
 
 logger = logging.getLogger(__name__)
 
+# Accepted $format values
+JSON_FORMATS = frozenset((None, "application/json", "json"))
+XML_FORMATS = frozenset((None, "application/xml", "xml"))
+JSON_HEADERS = types.MappingProxyType(
+    {"OData-Version": "4.0", "Content-Type": "application/json;charset=utf-8"}
+)
+XML_HEADERS = types.MappingProxyType(
+    {"OData-Version": "4.0", "Content-Type": "application/xml;charset=utf-8"}
+)
+
+
+class NavigationConverter(PathConverter):
+    # Navigation paths always start with a key predicate, reject anything
+    # else while routing instead of running the ABNF parser on it
+    regex = r"\(.*?"
+    part_isolating = False
+
 
 class ODataBluePrint(Blueprint):
     def make_setup_state(self, app, options, first_registration=False):
         state = super().make_setup_state(
             app, options, first_registration=first_registration
         )
-        edmx = edm.Edmx(options["options"].get("edmx"))
+        edmx = edm.Edmx.from_definition(options["options"].get("edmx"))
         mongo = options["options"].get("mongo")
+        app.url_map.converters["odata_navigation"] = NavigationConverter
 
+        # Service document entries do not depend on the request, so they are
+        # serialized only once
+        assets = dumps(
+            [
+                {
+                    "name": entity_set.Name,
+                    "kind": entity_set.__class__.__name__,
+                    "url": entity_set.Name,
+                }
+                for schema in edmx.DataServices.Schemas
+                for container in schema.EntityContainers
+                for entity_set in container.EntitySets
+                if entity_set.IncludeInServiceDocument
+            ]
+        )
         state.add_url_rule(
             "/",
             view_func=get_service_document,
             methods=("GET",),
             endpoint="root",
-            defaults={"edmx": edmx},
+            defaults={"edmx": edmx, "assets": assets},
         )
         state.add_url_rule(
             "/$metadata",
@@ -53,11 +97,10 @@ class ODataBluePrint(Blueprint):
             defaults={"edmx": edmx},
         )
 
-        edmx.process()
-        edmx.resolve_code_references()
         for schema in edmx.DataServices.Schemas:
             for container in schema.EntityContainers:
                 for entity_set in container.EntitySets:
+                    name = entity_set.Name
                     entity_type = entity_set.entity_type
                     collection_methods = ["GET"]
                     entry_methods = ["GET"]
@@ -80,9 +123,7 @@ class ODataBluePrint(Blueprint):
                         and entity_set.custom_insert_business is None
                     ):
                         logger.error(
-                            "EntitySet {} is managing an entity type that contains computed properties. The logic for initializing those computed properties has to be configured".format(
-                                entity_set.Name
-                            )
+                            f"EntitySet {name} is managing an entity type that contains computed properties. The logic for initializing those computed properties has to be configured"
                         )
                         insert_restrictions["Insertable"] = "False"
 
@@ -118,19 +159,6 @@ class ODataBluePrint(Blueprint):
                         entry_methods.append("DELETE")
 
                     # Main configuration
-                    if "Org.OData.Core.V1.ResourcePath" not in entity_set.annotations:
-                        entity_set.Annotations.append(
-                            edm.Annotation(
-                                {
-                                    "Term": "Org.OData.Core.V1.ResourcePath",
-                                    "String": entity_set.Name,
-                                }
-                            )
-                        )
-                        entity_set.annotations["Org.OData.Core.V1.ResourcePath"] = (
-                            entity_set.Annotations[-1]
-                        )
-
                     resource_path = edm.get_annotation(
                         entity_set, "Org.OData.Core.V1.ResourcePath"
                     )
@@ -141,7 +169,7 @@ class ODataBluePrint(Blueprint):
                         f"/{resource_path}",
                         view_func=entity_set_endpoint,
                         methods=collection_methods,
-                        endpoint=entity_set.Name,
+                        endpoint=name,
                         defaults={
                             "edmx": edmx,
                             "mongo": mongo,
@@ -153,7 +181,7 @@ class ODataBluePrint(Blueprint):
                         f"/{resource_path}(<key_predicate>)",
                         view_func=entity_set_entity_endpoint,
                         methods=entry_methods,
-                        endpoint=f"{entity_set.Name}$entity",
+                        endpoint=f"{name}$entity",
                         defaults={
                             "edmx": edmx,
                             "mongo": mongo,
@@ -164,7 +192,7 @@ class ODataBluePrint(Blueprint):
                         f"/{resource_path}/$count",
                         view_func=get_collection_count,
                         methods=("GET",),
-                        endpoint="{}$count".format(entity_set.Name),
+                        endpoint=f"{name}$count",
                         defaults={
                             "edmx": edmx,
                             "mongo": mongo,
@@ -172,10 +200,10 @@ class ODataBluePrint(Blueprint):
                         },
                     )
                     state.add_url_rule(
-                        f"/{resource_path}<path:navigation>",
+                        f"/{resource_path}<odata_navigation:navigation>",
                         view_func=get_entity_set,
                         methods=("GET", "PATCH"),
-                        endpoint=f"{entity_set.Name}#nav",
+                        endpoint=f"{name}#nav",
                         defaults={
                             "edmx": edmx,
                             "mongo": mongo,
@@ -190,35 +218,19 @@ class ODataBluePrint(Blueprint):
 odata_bp = ODataBluePrint("odata", __name__, url_prefix="/odata")
 
 
-def get_service_document(edmx):
+def get_service_document(edmx, assets=b"[]"):
     format = request.args.get("$format")
 
-    context = url_for("odata.$metadata", _external=True).replace("%24", "$")
-    headers = {"OData-Version": "4.0"}
-    assets = []
-    for schema in edmx.DataServices.Schemas:
-        for container in schema.EntityContainers:
-            for entity_set in container.EntitySets:
-                if entity_set.IncludeInServiceDocument:
-                    assets.append(entity_set)
-
-    if format in (None, "application/json", "json"):
-        document = {
-            "@odata.context": context,
-            "value": [
-                {
-                    "name": asset.Name,
-                    "kind": asset.__class__.__name__,
-                    "url": asset.Name,
-                }
-                for asset in assets
-            ],
-        }
-        headers["Content-Type"] = "application/json;charset=utf-8"
+    if format in JSON_FORMATS:
+        # assets contains the already serialized list of entries
+        document = b'{"@odata.context":%s,"value":%s}' % (
+            dumps(get_metadata_url()),
+            assets,
+        )
         return Response(
-            json.dumps(document, ensure_ascii=False).encode("utf-8"),
+            document,
             status=200,
-            headers=headers,
+            headers=JSON_HEADERS,
         )
     # elif format in ("application/xml", "xml"):
     #     headers["Content-Type"] = "application/xml;charset=utf-8"
@@ -230,48 +242,70 @@ def get_service_document(edmx):
 def get_metadata(edmx):
     format = request.args.get("$format")
 
-    headers = {"OData-Version": "4.0"}
-    if format in (None, "application/xml", "xml"):
-        headers["Content-Type"] = "application/xml;charset=utf-8"
-        return Response(
-            ET.tostring(edmx.xml(), encoding="utf-8", xml_declaration=True),
+    if format in XML_FORMATS:
+        response = Response(
+            edmx.xml_bytes(),
             status=200,
-            headers=headers,
+            headers=XML_HEADERS,
         )
-    elif format in (None, "application/json", "json"):
-        headers["Content-Type"] = "application/json;charset=utf-8"
-        return Response(
-            json.dumps(edmx.json(), ensure_ascii=False).encode("utf-8"),
+        response.set_etag(edmx.etag("xml"))
+    elif format in JSON_FORMATS:
+        response = Response(
+            edmx.json_bytes(),
             status=200,
-            headers=headers,
+            headers=JSON_HEADERS,
         )
+        response.set_etag(edmx.etag("json"))
     else:
         return Response(status=415)
 
+    return response.make_conditional(request)
 
+
+@functools.lru_cache(maxsize=256)
 def parse_prefer_header(value, version="4.0"):
-    data = {
-        key: values[-1] for key, values in urllib_parse_qs(value, separator=",").items()
-    }
+    # Preferences are tokens (RFC 7240), so there is no need for the
+    # percent-decoding done by parse_qs
+    data = {}
+    for preference in value.split(","):
+        key, _, pref_value = preference.partition("=")
+        key = key.strip()
+        pref_value = pref_value.strip()
+        if key != "" and pref_value != "":
+            data[key] = pref_value
 
     # maxpagesize
-    if version == "4.0" and "maxpagesize" in data:
-        del data["maxpagesize"]
+    if version == "4.0":
+        data.pop("maxpagesize", None)
 
-    if "odata.maxpagesize" in data:
-        data.setdefault("maxpagesize", data["odata.maxpagesize"])
-        del data["odata.maxpagesize"]
+    odata_maxpagesize = data.pop("odata.maxpagesize", None)
+    if odata_maxpagesize is not None:
+        data.setdefault("maxpagesize", odata_maxpagesize)
 
-    data["maxpagesize"] = int(data.get("maxpagesize", "25"))
-    if data["maxpagesize"] < 1:
-        data["maxpagesize"] = 25
-    elif data["maxpagesize"] > 100:
-        data["maxpagesize"] = 100
+    try:
+        maxpagesize = int(data.get("maxpagesize", 25))
+    except ValueError:
+        maxpagesize = 25
+
+    if maxpagesize < 1:
+        maxpagesize = 25
+    elif maxpagesize > 100:
+        maxpagesize = 100
+    data["maxpagesize"] = maxpagesize
 
     # return
     data.setdefault("return", "representation")
 
-    return data
+    # Results are shared between requests
+    return types.MappingProxyType(data)
+
+
+def parse_count_option():
+    count = request.args.get("$count")
+    if count is None or count == "false":
+        return False
+
+    return count == "true" or count.strip().lower() == "true"
 
 
 def get(
@@ -302,46 +336,52 @@ def get(
         RootEntitySet, subject.entity_type, expand_arg, projection, prefix=prefix
     )
 
-    filters = id_value
-    filters["uuid"] = {"$exists": True}
-
-    if prefix == "":
-        data = mongo_collection.find_one(filters, projection, session=session)
+    # Build filters without modifying id_value, it is owned by the caller
+    seq = id_value.get("Seq") if prefix != "" else None
+    if seq is None:
+        filters = {**id_value, "uuid": {"$exists": True}}
+        data = mongo_collection.find_one(
+            filters,
+            projection,
+            session=session,
+            max_time_ms=settings.MONGO_SEARCH_MAX_TIME_MS,
+        )
         if data is None:
             abort(404)
-    elif prefix != "":
-        seq = filters.pop("Seq") if "Seq" in id_value else None
 
+        if prefix != "":
+            # Same semantics as $unwind followed by $limit: 1
+            item = data.pop(prefix, None)
+            if isinstance(item, list):
+                item = item[0] if len(item) > 0 else None
+            if item is None:
+                abort(404)
+            data.update(item)
+    else:
+        # Pick the requested item directly instead of unwinding the array
+        filters = {key: value for key, value in id_value.items() if key != "Seq"}
+        filters["uuid"] = {"$exists": True}
+        filters[f"{prefix}.{seq}"] = {"$exists": True}
         pipeline = [
             {"$match": filters},
+            {"$limit": 1},
             {"$project": projection},
+            {
+                "$addFields": {
+                    prefix: {"$arrayElemAt": [f"${prefix}", seq]},
+                    "Seq": seq,
+                }
+            },
         ]
-        if seq is not None:
-            pipeline.extend(
-                [
-                    {
-                        "$unwind": {
-                            "path": f"${prefix}",
-                            "includeArrayIndex": "Seq",
-                        }
-                    },
-                    {"$match": {"Seq": seq}},
-                ]
-            )
-        else:
-            pipeline.append({"$unwind": f"${prefix}"})
-
-        pipeline.append({"$limit": 1})
-        results = tuple(
+        data = next(
             mongo_collection.aggregate(
                 pipeline, session=session, maxTimeMs=settings.MONGO_SEARCH_MAX_TIME_MS
-            )
+            ),
+            None,
         )
-        if len(results) == 0:
+        if data is None:
             abort(404)
-        data = results[0]
-        data.update(data[prefix])
-        del data[prefix]
+        data.update(data.pop(prefix))
 
     etag = str(data["uuid"])
 
@@ -359,9 +399,7 @@ def get(
     anchor = "{}/$entity".format(
         f"{RootEntitySet.Name}/{prefix}" if prefix != "" else RootEntitySet.Name
     )
-    data["@odata.context"] = "{}#{}".format(
-        url_for("odata.$metadata", _external=True).replace("%24", "$"), anchor
-    )
+    data["@odata.context"] = "{}#{}".format(get_metadata_url(), anchor)
     headers = build_response_headers()
     return make_response(data, status=200, etag=etag, headers=headers)
 
@@ -380,7 +418,7 @@ def get_property(mongo, RootEntitySet, id_value, prefers, Property, raw=False):
     if prefix != "":
         filters[prefix] = {"$exists": True}
 
-    data = mongo_collection.find_one(filters, {mongo_field: 1})
+    data = mongo_collection.find_one(filters, {"_id": 0, mongo_field: 1})
     if data is None:
         abort(404)
 
@@ -389,9 +427,7 @@ def get_property(mongo, RootEntitySet, id_value, prefers, Property, raw=False):
         keyPredicate = format_key_predicate(id_value)
         anchor = f"{RootEntitySet.Name}({keyPredicate})/{Property.Name}"
         data = {
-            "@odata.context": "{}#{}".format(
-                url_for("odata.$metadata", _external=True).replace("%24", "$"), anchor
-            ),
+            "@odata.context": "{}#{}".format(get_metadata_url(), anchor),
             "value": data,
         }
     headers = build_response_headers()
@@ -400,19 +436,29 @@ def get_property(mongo, RootEntitySet, id_value, prefers, Property, raw=False):
 
 def get_collection_count(edmx, mongo, EntitySet, filters=None):
     qs = parse_qs(request.query_string)
-
-    # Process filters
-    if filters is None:
-        filters = {"uuid": {"$exists": True}}
-
     filter_arg = qs.get("$filter", "")
     search_arg = qs.get("$search", "")
-    filters = process_collection_filters(
-        filter_arg, search_arg, filters, EntitySet.entity_type
-    )
-
     mongo_collection = mongo.get_collection(EntitySet.mongo_collection)
-    count = mongo_collection.count_documents(filters)
+
+    if (
+        settings.MONGO_ESTIMATE_UNFILTERED_COUNTS
+        and filters is None
+        and filter_arg == ""
+        and search_arg == ""
+        and EntitySet.prefix == ""
+    ):
+        count = mongo_collection.estimated_document_count(
+            maxTimeMS=settings.MONGO_COUNT_MAX_TIME_MS
+        )
+    else:
+        # Process filters
+        if filters is None:
+            filters = {"uuid": {"$exists": True}}
+
+        filters = process_collection_filters(
+            filter_arg, search_arg, filters, EntitySet.entity_type
+        )
+        count = mongo_collection.count_documents(filters)
 
     headers = build_response_headers()
     return make_response(count, status=200, headers=headers)
@@ -449,12 +495,7 @@ def validate_insert_payload(body, EntityType, deepinsert=False):
     for prop in EntityType.nullable_properties:
         body.setdefault(prop, None)
 
-    required_properties = (
-        set(p.Name for p in EntityType.properties.values())
-        - EntityType.computed_properties
-        - EntityType.nullable_properties
-    )
-    for prop in required_properties:
+    for prop in EntityType.required_properties:
         if prop not in body:
             abort(400)
 
@@ -593,10 +634,10 @@ def post_entity_set(mongo, edmx, EntitySet, body):
     )
     status = 204 if response_presentation == "minimal" else 201
 
-    headers = build_response_headers(_return=response_presentation)
-    headers["Location"] = "{}({})".format(
-        url_for("odata.{}".format(EntitySet.Name), _external=True),
-        format_key_predicate(extract_id_value(EntitySet.entity_type, body)),
+    key_predicate = format_key_predicate(extract_id_value(EntitySet.entity_type, body))
+    headers = build_response_headers(
+        _return=response_presentation,
+        Location=f"{get_entity_set_url(EntitySet)}({key_predicate})",
     )
 
     return make_response(response_body, status=status, headers=headers)
@@ -605,92 +646,78 @@ def post_entity_set(mongo, edmx, EntitySet, body):
 def get_entity_set(mongo, edmx, RootEntitySet, base_path, navigation=""):
     prefers = parse_prefer_header(request.headers.get("Prefer", ""))
 
-    if navigation != "":
-        # ABNF grammar is prepared to consume raw paths
-        navigation = request.environ["RAW_URI"][len(base_path) :]
+    if navigation == "":
+        return get_collection(
+            mongo, RootEntitySet, RootEntitySet, prefers, count=parse_count_option()
+        )
 
-        try:
-            tree = ODataGrammar("collectionNavPath").parse_all(navigation)
-        except abnf.parser.ParseError:
-            abort(404)
+    # ABNF grammar is prepared to consume raw paths
+    navigation = request.environ["RAW_URI"][len(base_path) :]
 
-        id_value = None
-        subject = RootEntitySet
-        count = raw = False
-        nav = tree
-        id_value = None
-        filters = {}
-        if nav.children[0].name == "keyPredicate":
-            id_value = parse_key_predicate(RootEntitySet.entity_type, nav.children[0])
-            if nav.children[1].value != "":
-                path = nav.children[1].children[1].value
-                if isinstance(subject, edm.EntitySet):
-                    if path in subject.entity_type.navproperties:
-                        # Navigate through navigation properties
-                        target = subject.entity_type.navproperties[path]
-                        # if not target.isembedded:
-                        #     # TODO the code in this block assumes a 1-N relationship, our side is the 1
-                        #     ref = mongo.get_collection(RootEntitySet.mongo_collection).find_one(id_value, projection={subject.Name: 1})
-                        #     if ref is None:
-                        #         abort(404)
-                        #     key_property = target.parent.key_properties[0]
-                        #     id_value = {
-                        #         key_property: ref[subject.Name]
-                        #     }
-
-                        # Navigate to the new node
-                        subject = target
-                        if subject.entity_type.Name in RootEntitySet.bindings:
-                            RootEntitySet = RootEntitySet.bindings[
-                                subject.entity_type.Name
-                            ]
-
-                        count = (
-                            len(nav.children[1].children) == 3
-                            and nav.children[1].children[2].name == "count"
-                        )
-                    elif path in subject.entity_type.properties:
-                        # Navigate through structural properties
-                        subject = subject.entity_type.properties[path]
-                        raw = (
-                            len(nav.children[1].children) == 3
-                            and nav.children[1].children[2].name == "value"
-                        )
-                    else:
-                        abort(404)
+    parsed_navigation = parse_navigation_path(navigation)
+    if parsed_navigation is None:
+        abort(404)
+
+    key_predicate, path, suffix = parsed_navigation
+
+    id_value = None
+    subject = RootEntitySet
+    count = raw = False
+    if key_predicate is not None:
+        id_value = parse_key_predicate(RootEntitySet.entity_type, key_predicate)
+        if path is not None:
+            if isinstance(subject, edm.EntitySet):
+                target = subject.entity_type.members.get(path)
+                if isinstance(target, edm.NavigationProperty):
+                    # Navigate through navigation properties
+                    # if not target.isembedded:
+                    #     # TODO the code in this block assumes a 1-N relationship, our side is the 1
+                    #     ref = mongo.get_collection(RootEntitySet.mongo_collection).find_one(id_value, projection={subject.Name: 1})
+                    #     if ref is None:
+                    #         abort(404)
+                    #     key_property = target.parent.key_properties[0]
+                    #     id_value = {
+                    #         key_property: ref[subject.Name]
+                    #     }
+
+                    # Navigate to the new node
+                    subject = target
+                    RootEntitySet = RootEntitySet.bindings.get(
+                        subject.entity_type.Name, RootEntitySet
+                    )
 
+                    count = suffix == "count"
+                elif target is not None:
+                    # Navigate through structural properties
+                    subject = target
+                    raw = suffix == "value"
                 else:
                     abort(404)
 
-        if isinstance(subject, edm.NavigationProperty):
-            if subject.iscollection:
-                count = request.args.get("$count", "false").strip().lower() == "true"
-                filters = {
-                    key_property: {"$eq": key_value}
-                    for key_property, key_value in id_value.items()
-                }
-                return get_collection(
-                    mongo, RootEntitySet, subject, prefers, filters=filters, count=count
-                )
-            else:
-                return get(mongo, RootEntitySet, subject, id_value, prefers)
-
-        elif isinstance(subject, edm.EntitySet):
-            if id_value is not None:
-                return get(mongo, RootEntitySet, subject, id_value, prefers)
             else:
-                count = request.args.get("$count", "false").strip().lower() == "true"
-                return get_collection(
-                    mongo, RootEntitySet, subject, prefers, count=count
-                )
-        elif isinstance(subject, edm.Property):
-            if id_value is None or count:
                 abort(404)
-            return get_property(
-                mongo, RootEntitySet, id_value, prefers, subject, raw=raw
+
+    if isinstance(subject, edm.NavigationProperty):
+        if subject.iscollection:
+            count = parse_count_option()
+            # {key: value} filters are equivalent to {key: {"$eq": value}}.
+            # id_value is freshly parsed for this request and not used
+            # afterwards, so it can be handed over (and extended) as is
+            return get_collection(
+                mongo, RootEntitySet, subject, prefers, filters=id_value, count=count
             )
         else:
+            return get(mongo, RootEntitySet, subject, id_value, prefers)
+
+    elif isinstance(subject, edm.EntitySet):
+        if id_value is not None:
+            return get(mongo, RootEntitySet, subject, id_value, prefers)
+        else:
+            count = parse_count_option()
+            return get_collection(mongo, RootEntitySet, subject, prefers, count=count)
+    elif isinstance(subject, edm.Property):
+        if id_value is None or count:
             abort(404)
+        return get_property(mongo, RootEntitySet, id_value, prefers, subject, raw=raw)
     else:
-        count = request.args.get("$count", "false").strip().lower() == "true"
-        return get_collection(mongo, RootEntitySet, RootEntitySet, prefers, count=count)
+        abort(404)
@@ -6,6 +6,19 @@ NODEFAULT = object()
 
 
 class attribute:
+
+    __slots__ = (
+        "_type",
+        "_items",
+        "static",
+        "default",
+        "json_default",
+        "xml_default",
+        "required",
+        "version",
+        "interned",
+    )
+
     def __init__(
         self,
         _type,
@@ -17,6 +30,7 @@ class attribute:
         items=None,
         min=None,
         version="4.0",
+        interned=False,
     ):
         self._type = _type
         self.static = static
@@ -31,6 +45,8 @@ class attribute:
             self.xml_default = xml_default if xml_default is not None else default
         self.required = required
         self.version = version
+        # Qualified type names are repeated across many elements, share them
+        self.interned = interned
 
         if _type == list:
             if items is None:
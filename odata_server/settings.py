@@ -11,3 +11,9 @@ MONGO_COUNT_MAX_TIME_MS = int(
 MONGO_SEARCH_MAX_TIME_MS = int(
     os.getenv("ODATA_SERVER_MONGO_SEARCH_MAX_TIME_MS", "30000")
 )
+
+# Use collection metadata for counting entity sets when no filter is applied.
+# Only enable it if every document of those collections represents an entity
+MONGO_ESTIMATE_UNFILTERED_COUNTS = os.getenv(
+    "ODATA_SERVER_MONGO_ESTIMATE_UNFILTERED_COUNTS", "false"
+).strip().lower() in ("1", "true", "yes")
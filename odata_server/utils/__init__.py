@@ -6,12 +6,12 @@ import abnf
 import pymongo.database
 import pymongo.errors
 from bson.son import SON
-from flask import abort, request, url_for
+from flask import abort, request
 
 from odata_server import edm, settings
 
 from .common import crop_result, format_key_predicate
-from .flask import add_odata_annotations
+from .flask import add_odata_annotations, get_metadata_url
 from .http import build_response_headers, make_response
 from .json import generate_collection_response
 from .mongo import build_initial_projection, get_mongo_prefix
@@ -351,7 +351,7 @@ def expand_result(EntitySet, expand_details, result, prefix=""):
             keyPredicate = format_key_predicate(main_id)
             anchor = "{}({})/{}".format(EntitySet.Name, keyPredicate, path)
             result["{}@odata.context".format(prop)] = "{}#{}".format(
-                url_for("odata.$metadata", _external=True).replace("%24", "$"), anchor
+                get_metadata_url(), anchor
             )
             if extra:
                 expand_result(EntitySet, extra, result[prop], prefix=path)
@@ -365,7 +365,7 @@ def expand_result(EntitySet, expand_details, result, prefix=""):
             keyPredicate = format_key_predicate(main_id)
             anchor = "{}({})/{}".format(EntitySet.Name, keyPredicate, path)
             result["{}@odata.context".format(prop)] = "{}#{}".format(
-                url_for("odata.$metadata", _external=True).replace("%24", "$"), anchor
+                get_metadata_url(), anchor
             )
 
         for i, e in enumerate(result[prop]):
@@ -509,7 +509,7 @@ def get_collection(
         odata_count = None
 
     odata_context = "{}#{}".format(
-        url_for("odata.$metadata", _external=True).replace("%24", "$"),
+        get_metadata_url(),
         RootEntitySet.Name,
     )
     prepare_kwargs = {
@@ -1,14 +1,38 @@
 # Copyright (c) 2021-2022 Future Internet Consulting and Development Solutions S.L.
 
-from flask import url_for
+from flask import current_app, request, url_for
 
 from .common import extract_id_value, format_key_predicate
 
+_URL_CACHE_SIZE = 256
+
+
+def _get_external_url(endpoint):
+    # External URLs only depend on the application and on the URL root used
+    # for accessing it, so cache them instead of calling url_for on each
+    # response.
+    cache = current_app.extensions.setdefault("odata_server.urls", {})
+    key = (request.url_root, endpoint)
+    url = cache.get(key)
+    if url is None:
+        if len(cache) >= _URL_CACHE_SIZE:
+            cache.clear()
+        url = cache[key] = url_for(endpoint, _external=True).replace("%24", "$")
+
+    return url
+
+
+def get_metadata_url():
+    return _get_external_url("odata.$metadata")
+
+
+def get_entity_set_url(entity_set):
+    return _get_external_url(f"odata.{entity_set.Name}")
+
 
 def add_odata_annotations(data, entity_set):
     key_predicate = format_key_predicate(extract_id_value(entity_set.entity_type, data))
-    base_url = url_for("odata.{}".format(entity_set.Name), _external=True)
-    data["@odata.id"] = f"{base_url}({key_predicate})"
+    data["@odata.id"] = f"{get_entity_set_url(entity_set)}({key_predicate})"
     data["@odata.etag"] = f'W/"{data["uuid"]}"'
     del data["uuid"]
 
@@ -1,16 +1,34 @@
 # Copyright (c) 2021-2022 Future Internet Consulting and Development Solutions S.L.
 
-import json
+import functools
 import types
 
 from flask import Response, request, stream_with_context
 
-from odata_server.utils.json import JSONEncoder
+from odata_server.utils.json import dumps
 
 
 def build_response_headers(
-    maxpagesize=None, _return=None, streaming=False, metadata="full", version="4.0"
+    maxpagesize=None,
+    _return=None,
+    streaming=False,
+    metadata="full",
+    version="4.0",
+    **extra
 ):
+    headers = _build_response_headers(
+        maxpagesize, _return, streaming, metadata, version
+    )
+    if extra:
+        return {**headers, **extra}
+
+    return headers
+
+
+@functools.lru_cache(maxsize=256)
+def _build_response_headers(maxpagesize, _return, streaming, metadata, version):
+    # Only a handful of distinct combinations are used in practice, so
+    # build each one once and share it as a read-only mapping
     preferences = {}
 
     if maxpagesize is not None:
@@ -39,16 +57,14 @@ def build_response_headers(
             ["{}={}".format(key, value) for key, value in preferences.items()]
         ),
     }
-    return headers
+    return types.MappingProxyType(headers)
 
 
 def make_response(data=None, status=200, etag=None, headers={}):
     if isinstance(data, types.GeneratorType):
         body = stream_with_context(data)
     elif data is not None:
-        body = json.dumps(
-            data, ensure_ascii=False, sort_keys=True, cls=JSONEncoder
-        ).encode("utf-8")
+        body = dumps(data, sort_keys=True)
     else:
         body = None
 
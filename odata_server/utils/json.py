@@ -8,7 +8,14 @@ from typing import Optional
 from urllib.parse import urlencode
 
 import pymongo.errors
-from flask import request, url_for
+from flask import request
+
+from odata_server.utils.flask import get_entity_set_url
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +49,39 @@ class JSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, o)
 
 
+_encoder = JSONEncoder()
+
+
+def dumps(data, sort_keys=False) -> bytes:
+    """Serialize ``data`` into UTF-8 encoded JSON.
+
+    orjson is used when it is installed, falling back to the stdlib
+    :mod:`json` module otherwise. Dates are serialized through
+    :class:`JSONEncoder` in both cases and non-string keys are accepted by
+    both, but the output is not identical in every case:
+
+    -   documents containing integers not fitting in 64 bits are serialized
+        by the stdlib module, as orjson rejects them.
+    -   ``NaN`` and infinite floats are written as ``null`` by orjson, while
+        the stdlib module writes the (non standard) ``NaN``/``Infinity``
+        tokens.
+    """
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(data, default=_encoder.default, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers not fitting in 64 bits, let the stdlib module
+            # serialize them (or raise its own error)
+            pass
+
+    return json.dumps(
+        data, ensure_ascii=False, sort_keys=sort_keys, cls=JSONEncoder
+    ).encode("utf-8")
+
+
 def _next_document(cursor: pymongo.cursor.Cursor) -> Optional[dict]:
     try:
         result = next(cursor)
@@ -80,9 +120,7 @@ def generate_collection_response(
             return
 
         data = prepare(result, **prepare_kwargs)
-        yield json.dumps(data, ensure_ascii=False, cls=JSONEncoder).encode(
-            "utf-8"
-        ) + b"\n"
+        yield dumps(data) + b"\n"
         pending_iterations -= 1
 
         while pending_iterations > 0:
@@ -93,9 +131,7 @@ def generate_collection_response(
                 return
 
             data = prepare(result, **prepare_kwargs)
-            yield b"," + json.dumps(data, ensure_ascii=False, cls=JSONEncoder).encode(
-                "utf-8"
-            ) + b"\n"
+            yield b"," + dumps(data) + b"\n"
             pending_iterations -= 1
     except StopIteration:
         pass
@@ -115,9 +151,9 @@ def generate_collection_response(
         query_params["$skip"] = offset + page_limit
 
         odata_next_link = b"%(path)s?%(params)s" % {
-            b"path": url_for(
-                "odata.{}".format(prepare_kwargs["RootEntitySet"].Name), _external=True
-            ).encode("utf-8"),
+            b"path": get_entity_set_url(prepare_kwargs["RootEntitySet"]).encode(
+                "utf-8"
+            ),
             b"params": urlencode(query_params).encode("utf-8"),
         }
         yield b',"@odata.nextLink":"%s"' % odata_next_link
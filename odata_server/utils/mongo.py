@@ -9,6 +9,11 @@ COMMA_RE = re.compile(r"\s*,\s*")
 
 
 def build_initial_projection(entity_type, select="", prefix="", anonymous=True):
+    select = unquote(select)
+    if prefix == "" and select in ("", "*"):
+        # Callers extend the returned projection (e.g. with $expand fields)
+        return dict(entity_type.default_projection), []
+
     projection = {
         "_id": 0,
         "uuid": 1,
@@ -18,7 +23,6 @@ def build_initial_projection(entity_type, select="", prefix="", anonymous=True):
     if prefix != "":
         prefix += "."
 
-    select = unquote(select)
     if select == "*":
         select = ""
 
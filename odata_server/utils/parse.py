@@ -1,9 +1,11 @@
 # Copyright (c) 2021-2022 Future Internet Consulting and Development Solutions S.L.
 
 import ast
+import functools
 import json
 import os
 import re
+import types
 from urllib.parse import unquote
 
 import abnf
@@ -25,6 +27,30 @@ class ODataGrammar(abnf.Rule):
 ODataGrammar.from_file(
     os.path.join(os.path.dirname(__file__), "..", "data", "odata.abnf")
 )
+COLLECTION_NAV_PATH_RULE = ODataGrammar("collectionNavPath")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_navigation_path(navigation):
+    # Returns a (keyPredicate node, property name, suffix segment name) tuple,
+    # or None if navigation is not valid. Results are cached as clients
+    # usually repeat the same paths (invalid ones included), so the returned
+    # nodes are shared and must not be modified.
+    try:
+        tree = COLLECTION_NAV_PATH_RULE.parse_all(navigation)
+    except abnf.parser.ParseError:
+        return None
+
+    key_predicate = path = suffix = None
+    if tree.children[0].name == "keyPredicate":
+        key_predicate = tree.children[0]
+        segment = tree.children[1] if len(tree.children) > 1 else None
+        if segment is not None and segment.value != "":
+            path = segment.children[1].value
+            if len(segment.children) == 3:
+                suffix = segment.children[2].name
+
+    return key_predicate, path, suffix
 
 
 def parse_array_or_object(node):
@@ -111,25 +137,24 @@ def parse_key_predicate(EntityType, key_predicate):
         abort(501)
 
 
+@functools.lru_cache(maxsize=256)
 def parse_qs(qs):
+    # Results are cached per query string as the same query options are
+    # usually repeated, so the returned mapping is read-only
     asdict = {}
-    aslist = []
     for name_value in qs.split(b"&"):
         if not name_value:
             continue
-        nv = name_value.split(b"=", 1)
-        if len(nv) != 2:
-            nv.append("")
+        name, _, value = name_value.partition(b"=")
 
-        name = unquote(nv[0].replace(b"+", b" ").decode("utf-8"))
+        name = unquote(name.replace(b"+", b" ").decode("utf-8"))
         # Extra feature not required by OData spec: strip whitespace from get parameters
         value = STRIP_WHITESPACE_FROM_URLENCODED_RE.sub(
-            "", nv[1].replace(b"+", b" ").decode("utf-8")
+            "", value.replace(b"+", b" ").decode("utf-8")
         )
-        aslist.append((name, value))
         asdict[name] = value
 
-    return asdict
+    return types.MappingProxyType(asdict)
 
 
 def parse_orderby(orderby_value):
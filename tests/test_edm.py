@@ -3,6 +3,7 @@
 import json
 import unittest
 import xml.etree.cElementTree as ET
+from unittest.mock import patch
 
 from odata_server import edm
 
@@ -86,7 +87,153 @@ ENTITY_SET1 = {
 }
 
 
+# Reference implementation of the serialization methods generated for each
+# EdmItem class, as they used to be implemented generically by EdmItem
+def _is_generated(item, method_name):
+    return getattr(getattr(type(item), method_name), "_generated", False)
+
+
+def generic_json(item, version="4.0"):
+    if not _is_generated(item, "json"):
+        return item.json()
+
+    cls = type(item)
+    if cls._wrapped_element is not None:
+        return [generic_json(e) for e in getattr(item, cls._wrapped_element)]
+
+    data = {}
+    for attr_name, attr in cls._attrs.items():
+        if attr.version > version:
+            continue
+
+        final_attr_name = "${}".format(attr_name)
+        if attr.static is not None:
+            data[final_attr_name] = attr.static
+            continue
+
+        value = getattr(item, attr_name)
+        if value is None:
+            continue
+        elif attr.type != list and issubclass(attr.type, edm.DataServices):
+            for entry in generic_json(value):
+                data[entry["$Namespace"]] = entry
+                del entry["$Namespace"]
+        elif attr.type != list and issubclass(attr.type, edm.EdmItem):
+            data[final_attr_name] = generic_json(value)
+        elif attr.type == list and issubclass(attr.items, edm.EdmItem):
+            if issubclass(attr.items, edm.NavigationPropertyBinding):
+                for entry in value:
+                    data[entry.Path] = entry.Target
+            elif issubclass(attr.items, edm.Annotation):
+                for e in value:
+                    key, avalue = e.json()
+                    data[key] = avalue
+            else:
+                subkind = (
+                    attr.items.__name__
+                    if attr.items.__name__ != cls._defaultsubkind
+                    else None
+                )
+                key = "${}".format(attr.items.jsonkey)
+                for e in value:
+                    subvalue = generic_json(e)
+                    key_value = subvalue.pop(key)
+                    if subkind is not None:
+                        subvalue["$Kind"] = subkind
+                    data[key_value] = subvalue
+        elif attr.json_default is None or value != attr.json_default:
+            data[final_attr_name] = value
+
+    return data
+
+
+def generic_xml(item, version="4.0"):
+    if not _is_generated(item, "xml"):
+        return item.xml()
+
+    cls = type(item)
+    root = ET.Element(cls._xml_tag)
+    for ns_prefix, ns_uri in cls._namespaces.items():
+        root.set("xmlns:{}".format(ns_prefix) if ns_prefix != "" else "xmlns", ns_uri)
+
+    for attr_name, attr in cls._attrs.items():
+        if attr.version > version:
+            continue
+
+        if attr.static is not None:
+            root.set(attr_name, attr.static)
+            continue
+
+        value = getattr(item, attr_name)
+        if value is None:
+            continue
+        elif attr.type != list and issubclass(attr.type, edm.EdmItem):
+            root.append(generic_xml(value))
+        elif attr.type == list and issubclass(attr.items, edm.EdmItem):
+            for e in value:
+                root.append(generic_xml(e))
+        elif attr.xml_default is None or value != attr.xml_default:
+            if type(value) is bool:
+                root.set(attr_name, "true" if value else "false")
+            else:
+                root.set(attr_name, str(value))
+
+    return root
+
+
+def iter_items(item):
+    yield item
+    for attr_name, attr in type(item)._attrs.items():
+        value = getattr(item, attr_name, None)
+        if isinstance(value, edm.EdmItem):
+            yield from iter_items(value)
+        elif isinstance(value, list):
+            for e in value:
+                if isinstance(e, edm.EdmItem):
+                    yield from iter_items(e)
+
+
 class EdmUnitTests(unittest.TestCase):
+    def assertGeneratedMethods(self, root):
+        # Compares the generated methods of every item in the model against
+        # the reference implementation
+        for item in iter_items(root):
+            for version in ("4.0", "4.01"):
+                with self.subTest(item=type(item).__name__, version=version):
+                    if _is_generated(item, "json"):
+                        self.assertEqual(
+                            item.json(version), generic_json(item, version)
+                        )
+
+                    if _is_generated(item, "xml"):
+                        expected = ET.tostring(
+                            generic_xml(item, version), encoding="unicode"
+                        )
+                        self.assertEqual(
+                            ET.tostring(item.xml(version), encoding="unicode"),
+                            expected,
+                        )
+                        if _is_generated(item, "_write_xml"):
+                            out = []
+                            item._write_xml(out, version)
+                            self.assertEqual("".join(out), expected)
+
+    def test_generated_methods(self):
+        edmx = edm.Edmx(
+            {
+                "DataServices": [
+                    dict(
+                        SCHEMA1,
+                        ComplexTypes=[ENTITY_TYPE2],
+                        EntityContainers=[
+                            {"Name": "Container", "EntitySets": [ENTITY_SET1]}
+                        ],
+                    ),
+                ],
+            }
+        )
+        self.assertGeneratedMethods(edmx)
+
     def test_action_minimal(self):
         e = edm.Action(
             {
@@ -127,6 +274,7 @@ class EdmUnitTests(unittest.TestCase):
             with self.subTest(field=field, value=value):
                 a = edm.Annotation({"Term": "OneTerm", field: value})
                 self.assertEqual(a.Term, "OneTerm")
+                self.assertEqual(a.type, field)
                 self.assertEqual(a.value, expected_value)
                 self.assertEqual(
                     ET.tostring(a.xml(), encoding="utf-8").decode("utf-8"),
@@ -171,12 +319,24 @@ class EdmUnitTests(unittest.TestCase):
             with self.subTest(field=field, value=value):
                 a = edm.Annotation({"Term": "OneTerm", field: value})
                 self.assertEqual(a.Term, "OneTerm")
+                self.assertEqual(a.type, field)
                 self.assertEqual(a.value, expected_value)
                 self.assertEqual(
                     ET.tostring(a.xml(), encoding="utf-8").decode("utf-8"),
                     '<Annotation Term="OneTerm">{}</Annotation>'.format(subelement),
                 )
                 self.assertEqual(a.json()[1], getattr(a, field).json())
+                self.assertEqual(a.xml_bytes(), ET.tostring(a.xml(), encoding="utf-8"))
+
+    def test_annotation_json_key(self):
+        a = edm.Annotation({"Term": "Core.Description", "String": "a"})
+        b = edm.Annotation(
+            {"Term": "Core.Description", "Qualifier": "short", "String": "b"}
+        )
+
+        self.assertEqual(a.json(), ("@Core.Description", "a"))
+        self.assertEqual(b.json(), ("@Core.Description#short", "b"))
+        self.assertIs(a.json()[0], edm.annotation_key("Core.Description"))
 
     def test_entity_set_minimal(self):
         e = edm.EntitySet({"Name": "Products", "EntityType": "Product"})
@@ -214,6 +374,84 @@ class EdmUnitTests(unittest.TestCase):
         self.assertEqual(e.Key.PropertyRefs[0].Name, "ID")
         self.assertEqual(len(e.Properties), 3)
 
+    def test_property_ref_alias_json(self):
+        a = edm.PropertyRef({"Name": "Info/ID", "Alias": "EntityInfoID"})
+        b = edm.PropertyRef({"Name": "Info/ID", "Alias": "EntityInfoID"})
+
+        self.assertEqual(a.json(), {"EntityInfoID": "Info/ID"})
+        self.assertIsNot(a.json(), b.json())
+
+    def test_entity_type_missing_required_attribute(self):
+        with self.assertRaisesRegex(ValueError, "Missing Name attribute"):
+            edm.EntityType({"Properties": []})
+
+        with self.assertRaisesRegex(ValueError, "Missing Name attribute"):
+            edm.EntityType({"Name": "h", "Properties": [{"Type": "Edm.String"}]})
+
+    def test_entity_type_properties(self):
+        e = edm.EntityType(
+            {
+                "Name": "h",
+                "Properties": [
+                    {"Name": "a", "Type": "Edm.String"},
+                    {"Name": "b", "Type": "Edm.Int32"},
+                ],
+            }
+        )
+
+        self.assertEqual(len(e.Properties), 2)
+        self.assertIsInstance(e.Properties[1], edm.Property)
+        self.assertIs(e.Properties[1].parent, e)
+        self.assertIs(e.Properties[1], e.Properties[1])
+        self.assertEqual([p.Name for p in e.Properties], ["a", "b"])
+        self.assertEqual(type(e.Properties + []), list)
+        self.assertIsInstance((e.Properties + [])[0], edm.Property)
+
+    def test_entity_type_nested_definitions_validated(self):
+        with self.assertRaisesRegex(ValueError, "Missing Name attribute"):
+            edm.Schema(
+                {
+                    "Namespace": "Testing",
+                    "EntityTypes": [
+                        {"Name": "h", "Properties": [{"Type": "Edm.String"}]}
+                    ],
+                }
+            )
+
+        with self.assertRaises(ValueError):
+            edm.EntityType(
+                {
+                    "Name": "h",
+                    "Properties": [
+                        {"Name": "a", "Type": "Edm.String", "MaxLength": "abc"}
+                    ],
+                }
+            )
+
+    def test_property_type_interned(self):
+        a = edm.Property({"Name": "a", "Type": "".join(("Edm.", "Int32"))})
+        b = edm.Property({"Name": "b", "Type": "".join(("Edm.", "Int32"))})
+
+        self.assertEqual(a.Type, "Edm.Int32")
+        self.assertIs(a.Type, b.Type)
+
+    def test_parse_type(self):
+        self.assertEqual(
+            edm.parse_type("Collection(ODataDemo.Product)"),
+            (True, "ODataDemo.Product", "Product"),
+        )
+        self.assertEqual(edm.parse_type("Edm.String"), (False, "Edm.String", "String"))
+
+    def test_property_attributes_use_slots(self):
+        p = edm.Property({"Name": "a", "Type": "Edm.String"})
+
+        self.assertIn("Name", edm.Property.__slots__)
+        self.assertIn("iscollection", edm.Property.__slots__)
+        self.assertEqual(p.__dict__, {})
+        p.iscollection = False
+        p.custom = True
+        self.assertEqual(p.__dict__, {"custom": True})
+
     def test_schema_minimal(self):
         s = edm.Schema({"Namespace": "Testing"})
         self.assertEqual(s.Namespace, "Testing")
@@ -243,6 +481,70 @@ class EdmUnitTests(unittest.TestCase):
         self.assertEqual(len(d.Schemas), 1)
         self.assertEqual(type(d.json()), list)
 
+    def test_edmx_from_definition(self):
+        definition = {"DataServices": [SCHEMA1]}
+
+        edmx = edm.Edmx.from_definition(definition)
+        self.assertIsInstance(edmx, edm.Edmx)
+        self.assertEqual(edmx.get_entity_type("Testing.Shipping").Name, "Shipping")
+        self.assertIs(edm.Edmx.from_definition(dict(definition)), edmx)
+        self.assertIsNot(
+            edm.Edmx.from_definition({"DataServices": [{"Namespace": "Other"}]}), edmx
+        )
+
+        self.assertIsNot(
+            edm.Edmx(definition)._serialization_lock, edmx._serialization_lock
+        )
+
+        invalid_definition = {
+            "DataServices": [
+                {
+                    "Namespace": "Invalid",
+                    "EntityTypes": [
+                        {
+                            "Name": "P",
+                            "Key": [{"Name": "ID"}],
+                            "Properties": [
+                                {"Name": "ID", "Type": "Edm.Int32", "Nullable": True}
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+        for i in range(2):
+            with self.subTest(attempt=i):
+                with self.assertRaisesRegex(ValueError, "nullable key property"):
+                    edm.Edmx.from_definition(invalid_definition)
+
+        with patch.object(edm, "_EDMX_CACHE_SIZE", 1):
+            edm.Edmx.from_definition({"DataServices": [{"Namespace": "Third"}]})
+            self.assertEqual(len(edm._EDMX_CACHE), 1)
+            self.assertIsNot(edm.Edmx.from_definition(definition), edmx)
+
+    def test_edmx_get_entity_type(self):
+        edmx = edm.Edmx({"DataServices": [SCHEMA1]})
+        edmx.process()
+
+        shipping = edmx.get_entity_type("Testing.Shipping")
+        self.assertEqual(shipping.Name, "Shipping")
+        self.assertEqual(shipping.members, shipping.properties)
+        with self.assertRaises(TypeError):
+            shipping.properties["Unknown"] = None
+        self.assertIsInstance(shipping.computed_properties, frozenset)
+        self.assertEqual(
+            set(shipping.required_properties),
+            set(shipping.properties)
+            - shipping.computed_properties
+            - shipping.nullable_properties,
+        )
+        self.assertIs(edmx.get_entity_type("t.Shipping"), shipping)
+        self.assertEqual(edmx.get_entity_type("t.Employee").Name, "Employee")
+        self.assertIsNone(edmx.get_entity_type("Testing.Unknown"))
+
+    def test_resolve_code_reference(self):
+        self.assertIs(edm.resolve_code_reference("json.dumps"), json.dumps)
+
     def test_navigation_property(self):
         test_data = (
             (False, False, True),
@@ -433,6 +735,9 @@ class EdmUnitTests(unittest.TestCase):
         self.assertEqual(len(s.EntityTypes), 1)
         self.assertEqual(len(s.ComplexTypes), 1)
         self.assertEqual(len(s.EntityContainers), 1)
+        self.assertEqual(
+            s.json()["Category"]["$Key"], [{"EntityInfoID": "Info/ID"}]
+        )
         print(json.dumps(s.json(), indent=4))
 
     def test_edmx(self):
@@ -534,6 +839,24 @@ class EdmUnitTests(unittest.TestCase):
 
         ET.tostring(edmx.xml())
 
+        self.assertGeneratedMethods(edmx)
+
+        with self.subTest(msg="Cached serializations"):
+            self.assertIsNot(edmx.json(), edmx.json())
+            edmx.json()["$Version"] = "modified"
+            self.assertEqual(edmx.json()["$Version"], "4.0")
+            self.assertIs(edmx.xml_bytes(), edmx.xml_bytes())
+            self.assertIs(edmx.json_bytes(), edmx.json_bytes())
+            self.assertEqual(json.loads(edmx.json_bytes()), edmx.json())
+            self.assertIs(edmx.etag("xml"), edmx.etag("xml"))
+            self.assertNotEqual(edmx.etag("xml"), edmx.etag("json"))
+
+        with self.subTest(msg="XML serialization (direct writer)"):
+            self.assertEqual(
+                edmx.xml_bytes(),
+                ET.tostring(edmx.xml(), encoding="utf-8", xml_declaration=True),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -6,7 +6,9 @@ from unittest.mock import ANY, Mock, patch
 import werkzeug
 from flask import Flask
 
-from odata_server.flask import odata_bp
+from odata_server import edm, settings
+from odata_server.flask import get, odata_bp, parse_count_option, parse_prefer_header
+from odata_server.utils.flask import get_entity_set_url
 
 edmx = {
     "DataServices": [
@@ -160,11 +162,88 @@ app = Flask(__name__)
 app.register_blueprint(odata_bp, options={"mongo": mongo, "edmx": edmx}, url_prefix="")
 
 
+class PreferHeaderTestCase(unittest.TestCase):
+    def test_parse_prefer_header(self):
+        test_data = (
+            ("", DEFAULT_PREFERS),
+            ("return=minimal", {"maxpagesize": 25, "return": "minimal"}),
+            ("odata.maxpagesize=10", {"maxpagesize": 10, "return": "representation"}),
+            ("odata.maxpagesize=0", DEFAULT_PREFERS),
+            (
+                "odata.maxpagesize=1000",
+                {"maxpagesize": 100, "return": "representation"},
+            ),
+            ("maxpagesize=10", DEFAULT_PREFERS),
+            ("odata.maxpagesize=abc", DEFAULT_PREFERS),
+            (
+                "return=minimal, odata.maxpagesize=10",
+                {"maxpagesize": 10, "return": "minimal"},
+            ),
+            ("respond-async,return=minimal", {"maxpagesize": 25, "return": "minimal"}),
+        )
+        for value, expected in test_data:
+            with self.subTest(value=value):
+                self.assertEqual(dict(parse_prefer_header(value)), expected)
+
+    def test_parse_prefer_header_cached(self):
+        prefers = parse_prefer_header("return=minimal")
+        self.assertIs(parse_prefer_header("return=minimal"), prefers)
+        with self.assertRaises(TypeError):
+            prefers["return"] = "representation"
+
+
+class CountOptionTestCase(unittest.TestCase):
+    def test_parse_count_option(self):
+        test_data = (
+            ("", False),
+            ("?$count=false", False),
+            ("?$count=true", True),
+            ("?$count=%20TRUE%20", True),
+            ("?$count=other", False),
+        )
+        for qs, expected in test_data:
+            with self.subTest(qs=qs):
+                with app.test_request_context(f"/Products{qs}"):
+                    self.assertEqual(parse_count_option(), expected)
+
+
 class BluePrintTestCase(unittest.TestCase):
     def setUp(self):
         mongo.reset_mock(return_value=True, side_effect=True)
         self.app = app.test_client()
 
+    def test_get_entity_set_url(self):
+        EntitySet = Mock()
+        EntitySet.Name = "Products"
+        with app.test_request_context(base_url="http://example.com"):
+            self.assertEqual(
+                get_entity_set_url(EntitySet), "http://example.com/Products"
+            )
+            with patch("odata_server.utils.flask.url_for") as url_for:
+                self.assertEqual(
+                    get_entity_set_url(EntitySet), "http://example.com/Products"
+                )
+            url_for.assert_not_called()
+
+        with app.test_request_context(base_url="http://other.example.com"):
+            self.assertEqual(
+                get_entity_set_url(EntitySet), "http://other.example.com/Products"
+            )
+
+    def test_service_document(self):
+        response = self.app.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["OData-Version"], "4.0")
+        self.assertEqual(response.json["@odata.context"], "http://localhost/$metadata")
+        self.assertIn(
+            {"name": "Products", "kind": "EntitySet", "url": "Products"},
+            response.json["value"],
+        )
+
+    def test_service_document_format_param_not_supported(self):
+        response = self.app.get("/?$format=xml")
+        self.assertEqual(response.status_code, 415)
+
     def test_metadata_api_default_xml(self):
         response = self.app.get("/$metadata")
         self.assertEqual(response.status_code, 200)
@@ -189,6 +268,84 @@ class BluePrintTestCase(unittest.TestCase):
             response.headers["Content-Type"], "application/json;charset=utf-8"
         )
 
+    def test_metadata_api_etag(self):
+        for format in ("xml", "json"):
+            with self.subTest(format=format):
+                response = self.app.get(f"/$metadata?$format={format}")
+                self.assertEqual(response.status_code, 200)
+                etag = response.headers["ETag"]
+
+                response = self.app.get(
+                    f"/$metadata?$format={format}", headers={"If-None-Match": etag}
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.data, b"")
+
+    def test_register_invalid_definition_twice(self):
+        definition = {
+            "DataServices": [
+                {
+                    "Namespace": "Invalid",
+                    "EntityTypes": [
+                        {
+                            "Name": "P",
+                            "Key": [{"Name": "ID"}],
+                            "Properties": [
+                                {"Name": "ID", "Type": "Edm.Int32", "Nullable": True}
+                            ],
+                        }
+                    ],
+                    "EntityContainers": [
+                        {
+                            "Name": "Container",
+                            "EntitySets": [{"Name": "Ps", "EntityType": "Invalid.P"}],
+                        }
+                    ],
+                }
+            ]
+        }
+
+        for i in range(2):
+            with self.subTest(attempt=i):
+                with self.assertRaisesRegex(
+                    ValueError, "Entity Type P has a nullable key property: ID"
+                ):
+                    Flask(__name__).register_blueprint(
+                        odata_bp, options={"mongo": mongo, "edmx": definition}
+                    )
+
+    def test_register_several_apps(self):
+        clients = []
+        for url_prefix in ("/a", "/b/c"):
+            other_app = Flask(__name__)
+            other_app.register_blueprint(
+                odata_bp,
+                options={"mongo": mongo, "edmx": edmx},
+                url_prefix=url_prefix,
+            )
+            clients.append((url_prefix, other_app.test_client()))
+
+        metadata = self.app.get("/$metadata?$format=json").json
+        metadata_xml = self.app.get("/$metadata").data
+        for url_prefix, client in clients:
+            with self.subTest(url_prefix=url_prefix):
+                response = client.get(f"{url_prefix}/$metadata?$format=json")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json, metadata)
+                self.assertEqual(
+                    response.json["ODataDemo"]["DemoService"]["Products"][
+                        "@Org.OData.Core.V1.ResourcePath"
+                    ],
+                    "Products",
+                )
+
+                response = client.get(f"{url_prefix}/$metadata")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, metadata_xml)
+                self.assertEqual(
+                    response.data.count(b'Term="Org.OData.Core.V1.ResourcePath"'), 3
+                )
+
     def test_metadata_api_format_param_not_supported(self):
         response = self.app.get("/$metadata?$format=yaml")
         self.assertEqual(response.status_code, 415)
@@ -244,6 +401,16 @@ class BluePrintTestCase(unittest.TestCase):
         response = self.app.get("/Products(rer")
         self.assertEqual(response.status_code, 404)
 
+    @patch("odata_server.flask.parse_navigation_path")
+    def test_get_entity_collection_invalid_navigation_rejected_by_router(
+        self, parse_navigation_path
+    ):
+        for path in ("/ProductsX", "/Products$value", "/Products)"):
+            with self.subTest(path=path):
+                response = self.app.get(path)
+                self.assertEqual(response.status_code, 404)
+                parse_navigation_path.assert_not_called()
+
     def test_get_entity_collection_api_orderby(self):
         test_data = (
             ("Name", [("Name", 1)]),
@@ -313,6 +480,21 @@ class BluePrintTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json, 3)
 
+    @patch("odata_server.settings.MONGO_ESTIMATE_UNFILTERED_COUNTS", new=True)
+    def test_get_entity_collection_count_value_estimated(self):
+        mongo.get_collection().estimated_document_count.return_value = 3
+        response = self.app.get("/Categories/$count")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, 3)
+        mongo.get_collection().count_documents.assert_not_called()
+
+        mongo.get_collection().count_documents.return_value = 1
+        response = self.app.get("/Categories/$count?$filter=ID eq 1")
+        self.assertEqual(response.status_code, 200)
+        mongo.get_collection().count_documents.assert_called_once_with(
+            {"uuid": {"$exists": True}, "ID": {"$eq": 1}}
+        )
+
     @patch("odata_server.flask.get_collection")
     def test_get_entity_collection_count(self, get_collection):
         get_collection.return_value = ({"@odata.count": 3}, 200)
@@ -326,7 +508,7 @@ class BluePrintTestCase(unittest.TestCase):
         response = self.app.get("/Categories(0)/Products")
         self.assertEqual(response.status_code, 200)
         get_collection.assert_called_once_with(
-            mongo, ANY, ANY, DEFAULT_PREFERS, filters={"ID": {"$eq": 0}}, count=False
+            mongo, ANY, ANY, DEFAULT_PREFERS, filters={"ID": 0}, count=False
         )
 
     @patch("odata_server.flask.get")
@@ -350,6 +532,97 @@ class BluePrintTestCase(unittest.TestCase):
         response = self.app.get("/Categories?$expand=Products")
         self.assertEqual(response.status_code, 200)
 
+    def build_prefixed_entity_set(self, key=({"Name": "ID"}, {"Name": "Seq"})):
+        RootEntitySet = edm.EntitySet({"Name": "Products", "EntityType": "Product"})
+        RootEntitySet.prefix = "products"
+        RootEntitySet.mongo_collection = "product"
+        RootEntitySet.entity_type = edm.EntityType(
+            {
+                "Name": "Product",
+                "Key": list(key),
+                "Properties": [
+                    {"Name": "ID", "Type": "Edm.String", "Nullable": False},
+                    {"Name": "Seq", "Type": "Edm.Int16", "Nullable": False},
+                    {"Name": "Name", "Type": "Edm.String", "Nullable": False},
+                ],
+            }
+        )
+        edm.process_entity_type(RootEntitySet.entity_type)
+        return RootEntitySet
+
+    def test_get_prefixed_entity(self):
+        RootEntitySet = self.build_prefixed_entity_set(key=({"Name": "ID"},))
+        test_data = (
+            ({"Name": "b"}, 200),
+            ([{"Name": "b"}, {"Name": "c"}], 200),
+            ([], 404),
+            (None, 404),
+        )
+        for item, status in test_data:
+            with self.subTest(item=item):
+                mongo.reset_mock(return_value=True)
+                mongo.get_collection().find_one.return_value = {
+                    "ID": "a",
+                    "uuid": "abc",
+                    "products": item,
+                }
+
+                with app.test_request_context():
+                    if status == 404:
+                        with self.assertRaises(werkzeug.exceptions.NotFound):
+                            get(mongo, RootEntitySet, RootEntitySet, {"ID": "a"}, {})
+                    else:
+                        response = get(
+                            mongo, RootEntitySet, RootEntitySet, {"ID": "a"}, {}
+                        )
+                        self.assertEqual(response.status_code, status)
+                        self.assertEqual(response.json["Name"], "b")
+
+                mongo.get_collection().find_one.assert_called_once_with(
+                    {"ID": "a", "uuid": {"$exists": True}},
+                    ANY,
+                    session=None,
+                    max_time_ms=settings.MONGO_SEARCH_MAX_TIME_MS,
+                )
+                mongo.get_collection().aggregate.assert_not_called()
+
+    def test_get_prefixed_entity_seq(self):
+        RootEntitySet = self.build_prefixed_entity_set()
+        mongo.get_collection().aggregate.return_value = iter(
+            ({"ID": "a", "Seq": 1, "uuid": "abc", "products": {"Name": "b"}},)
+        )
+
+        id_value = {"ID": "a", "Seq": 1}
+        with app.test_request_context():
+            response = get(mongo, RootEntitySet, RootEntitySet, id_value, {})
+
+        self.assertEqual(id_value, {"ID": "a", "Seq": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["Name"], "b")
+        self.assertEqual(response.json["Seq"], 1)
+        pipeline = mongo.get_collection().aggregate.call_args[0][0]
+        self.assertEqual(
+            pipeline[0],
+            {
+                "$match": {
+                    "ID": "a",
+                    "uuid": {"$exists": True},
+                    "products.1": {"$exists": True},
+                }
+            },
+        )
+        self.assertEqual(pipeline[1], {"$limit": 1})
+        self.assertEqual(
+            pipeline[3],
+            {
+                "$addFields": {
+                    "products": {"$arrayElemAt": ["$products", 1]},
+                    "Seq": 1,
+                }
+            },
+        )
+        self.assertNotIn("$unwind", [stage for s in pipeline for stage in s])
+
     def test_post_entity_collection_single_entity(self):
         for label, payload in (
             ("Minimal payload", MINIMAL_PAYLOAD),
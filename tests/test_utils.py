@@ -476,7 +476,8 @@ class UtilsTestCase(unittest.TestCase):
 
     @unittest.mock.patch("odata_server.utils.parse_qs", return_value={})
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -525,7 +526,8 @@ class UtilsTestCase(unittest.TestCase):
         new=unittest.mock.Mock(return_value=(("ID", 1),)),
     )
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -570,7 +572,8 @@ class UtilsTestCase(unittest.TestCase):
 
     @unittest.mock.patch("odata_server.utils.parse_qs", return_value={})
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -616,7 +619,8 @@ class UtilsTestCase(unittest.TestCase):
 
     @unittest.mock.patch("odata_server.utils.parse_qs", return_value={})
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -665,7 +669,8 @@ class UtilsTestCase(unittest.TestCase):
         new=unittest.mock.Mock(return_value=(("ID", 1),)),
     )
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -714,7 +719,8 @@ class UtilsTestCase(unittest.TestCase):
         new=unittest.mock.Mock(return_value={"Seq": {"$gt": 1}}),
     )
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -759,7 +765,8 @@ class UtilsTestCase(unittest.TestCase):
 
     @unittest.mock.patch("odata_server.utils.parse_qs", return_value={})
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -807,7 +814,8 @@ class UtilsTestCase(unittest.TestCase):
 
     @unittest.mock.patch("odata_server.utils.parse_qs", return_value={})
     @unittest.mock.patch(
-        "odata_server.utils.url_for", new=unittest.mock.Mock(return_value="/$metadata")
+        "odata_server.utils.get_metadata_url",
+        new=unittest.mock.Mock(return_value="/$metadata"),
     )
     @unittest.mock.patch(
         "odata_server.utils.flask.url_for",
@@ -5,7 +5,7 @@ import unittest
 
 from flask import Flask
 
-from odata_server.utils.http import make_response
+from odata_server.utils.http import build_response_headers, make_response
 
 
 class HTTPUtilsTestCase(unittest.TestCase):
@@ -13,6 +13,30 @@ class HTTPUtilsTestCase(unittest.TestCase):
     def setUpClass(cls):
         cls.app = Flask("tests")
 
+    def test_build_response_headers(self):
+        headers = build_response_headers(streaming=True, maxpagesize=25)
+
+        self.assertEqual(
+            headers,
+            {
+                "Content-Type": "application/json;odata.metadata=full;charset=utf-8;odata.streaming=true",
+                "OData-Version": "4.0",
+                "Preference-Applied": "odata.maxpagesize=25",
+            },
+        )
+        self.assertIs(build_response_headers(streaming=True, maxpagesize=25), headers)
+        with self.assertRaises(TypeError):
+            headers["Location"] = "http://localhost"
+
+    def test_build_response_headers_extra(self):
+        headers = build_response_headers(
+            _return="minimal", Location="http://localhost/odata/Products(1)"
+        )
+
+        self.assertEqual(headers["Location"], "http://localhost/odata/Products(1)")
+        self.assertEqual(headers["Preference-Applied"], "return=minimal")
+        self.assertNotIn("Location", build_response_headers(_return="minimal"))
+
     @unittest.mock.patch("odata_server.utils.http.stream_with_context")
     @unittest.mock.patch("odata_server.utils.http.Response")
     def test_make_response(self, Response, stream_with_context):
@@ -1,12 +1,15 @@
 # Copyright (c) 2022 Future Internet Consulting and Development Solutions S.L.
 
+import datetime
 import json
 import unittest
+import unittest.mock
+import uuid
 from types import SimpleNamespace
 
 import flask
 
-from odata_server.utils.json import generate_collection_response
+from odata_server.utils.json import dumps, generate_collection_response, orjson
 
 
 def view():
@@ -14,6 +17,47 @@ def view():
 
 
 class JSONTestCase(unittest.TestCase):
+    def test_dumps(self):
+        body = dumps(
+            {
+                "b": datetime.datetime(2022, 1, 2, 3, 4, 5),
+                "a": uuid.UUID("c4e5bf9d-7d1b-4ee5-bba4-34d4b8b0a23f"),
+                "c": datetime.date(2022, 1, 2),
+                "d": "ñ",
+            },
+            sort_keys=True,
+        )
+
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(
+            json.loads(body),
+            {
+                "a": "c4e5bf9d-7d1b-4ee5-bba4-34d4b8b0a23f",
+                "b": "2022-01-02T03:04:05Z",
+                "c": "2022-01-02",
+                "d": "ñ",
+            },
+        )
+        self.assertIn("ñ".encode("utf-8"), body)
+        self.assertLess(body.index(b'"a"'), body.index(b'"b"'))
+
+    def test_dumps_stdlib_fallback(self):
+        with unittest.mock.patch("odata_server.utils.json.orjson", None):
+            body = dumps({"b": datetime.date(2022, 1, 2), "a": "ñ", 1: 2**70})
+
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(json.loads(body), {"b": "2022-01-02", "a": "ñ", "1": 2**70})
+        self.assertIn("ñ".encode("utf-8"), body)
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_dumps_orjson(self):
+        self.assertEqual(dumps({1: 2}), b'{"1":2}')
+        self.assertEqual(dumps({"a": float("nan")}), b'{"a":null}')
+
+        # Integers not fitting in 64 bits are handled by the stdlib module
+        body = dumps({"b": datetime.date(2022, 1, 2), "a": 2**70})
+        self.assertEqual(json.loads(body), {"b": "2022-01-02", "a": 2**70})
+
     def test_generate_collection_response(self):
         app = flask.Flask(__name__)
         app.add_url_rule("/Product", view_func=view, endpoint="odata.Product")
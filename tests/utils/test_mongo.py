@@ -206,6 +206,37 @@ class MongoUtilsTestCase(unittest.TestCase):
 
                 self.assertEqual(expected_result, projection)
 
+    def test_build_initial_projection_default(self):
+        entity_type = edm.EntityType(ENTITY_TYPE_1)
+        edm.process_entity_type(entity_type)
+        expected = (
+            {
+                "_id": 0,
+                "uuid": 1,
+                "ID": 1,
+                "description": 1,
+                "price": 1,
+                "name": 1,
+            },
+            [],
+        )
+
+        for select in ("", "*", "%2A"):
+            for anonymous in (True, False):
+                with self.subTest(select=select, anonymous=anonymous):
+                    projection, fields_to_remove = build_initial_projection(
+                        entity_type, select=select, anonymous=anonymous
+                    )
+                    self.assertEqual((projection, fields_to_remove), expected)
+
+                    # Returned values can be extended by the caller
+                    projection["Category"] = 1
+                    fields_to_remove.append("Category")
+                    self.assertEqual(
+                        build_initial_projection(entity_type, select=select),
+                        expected,
+                    )
+
     def test_get_mongo_prefix(self):
         List = edm.EntityType(
             {
@@ -10,8 +10,10 @@ import werkzeug
 from odata_server.utils.parse import (
     ODataGrammar,
     parse_key_predicate,
+    parse_navigation_path,
     parse_orderby,
     parse_primitive_literal,
+    parse_qs,
 )
 
 
@@ -143,6 +145,45 @@ class ParseUtilsTestCase(unittest.TestCase):
                     Exception, parse_key_predicate, EntityType, key_predicate
                 )
 
+    def test_parse_navigation_path(self):
+        test_data = (
+            ("(5)", "(5)", None, None),
+            ("(5)/Category", "(5)", "Category", None),
+            ("(5)/Description/$value", "(5)", "Description", "value"),
+        )
+        for value, key_predicate, path, suffix in test_data:
+            with self.subTest(value=value):
+                result = parse_navigation_path(value)
+                self.assertEqual(result[0].name, "keyPredicate")
+                self.assertEqual(result[0].value, key_predicate)
+                self.assertEqual(result[1:], (path, suffix))
+
+        self.assertIs(
+            parse_navigation_path("(5)/Category"), parse_navigation_path("(5)/Category")
+        )
+
+        # Invalid paths are cached too
+        parse_navigation_path.cache_clear()
+        self.assertIsNone(parse_navigation_path("(5/Category"))
+        self.assertIsNone(parse_navigation_path("(5/Category"))
+        self.assertEqual(parse_navigation_path.cache_info().hits, 1)
+
+    def test_parse_qs(self):
+        test_data = (
+            (b"", {}),
+            (b"$top=5", {"$top": "5"}),
+            (b"%24select=Name&$expand=", {"$select": "Name", "$expand": ""}),
+            (b"$filter=+Name%20eq%20%27a%27%20", {"$filter": "Name%20eq%20%27a%27"}),
+            (b"$count&&$skip=1", {"$count": "", "$skip": "1"}),
+        )
+        for value, expected in test_data:
+            with self.subTest(value=value):
+                self.assertEqual(dict(parse_qs(value)), expected)
+
+        self.assertIs(parse_qs(b"$top=5"), parse_qs(b"$top=5"))
+        with self.assertRaises(TypeError):
+            parse_qs(b"$top=5")["$top"] = "6"
+
     def test_parse_orderby(self):
         test_data = (
             ("", []),